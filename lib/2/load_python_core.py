@@ -7,8 +7,10 @@ from __future__ import unicode_literals
 
 import imp
 
+from code_cache import compile_source
+
 def do_compile_internal(obj, src, path, modname, modpath, nsvars=None, ignorable_exceptions=None):
-    compiled = compile(src, path, 'exec')
+    compiled = compile_source(src, path, modpath)
 
     mod = imp.new_module(modname)
     mod.__file__ = modpath
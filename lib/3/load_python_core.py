@@ -9,8 +9,10 @@ import importlib
 import importlib.util
 import importlib.machinery
 
+from code_cache import compile_source
+
 def do_compile_internal(obj, src, path, modname, modpath, nsvars=None, ignorable_exceptions=None):
-    compiled = compile(src, path, 'exec')
+    compiled = compile_source(src, path, modpath)
 
     mod = importlib.util.module_from_spec(importlib.machinery.ModuleSpec(modname, None, origin=modpath))
 
@@ -0,0 +1,86 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# NB: compile() below inherits the __future__ flags of this module, which must stay the same as
+# the ones in load_python_core so that cached and freshly compiled code behave the same
+
+import hashlib
+import marshal
+import os
+
+from util import mkdir_p
+
+try:
+    from importlib.util import MAGIC_NUMBER as _MAGIC
+except ImportError:
+    import imp
+    _MAGIC = imp.get_magic()
+
+_CACHE_DIR = None
+_STATS = {'hits': 0, 'misses': 0}
+
+
+def set_cache_dir(path):
+    global _CACHE_DIR
+    _CACHE_DIR = path
+
+
+def get_stats():
+    return dict(_STATS)
+
+
+def stats_line():
+    total = _STATS['hits'] + _STATS['misses']
+    if total == 0:
+        return 'bytecode cache: no files compiled'
+    return 'bytecode cache: {} hits, {} misses ({:.0f}% hit rate)'.format(
+        _STATS['hits'], _STATS['misses'], 100.0 * _STATS['hits'] / total)
+
+
+def _key(path, filename):
+    # the magic number is part of the name so that different python versions don't fight over a file
+    h = hashlib.sha1('{}\0{}'.format(path, filename).encode('utf8'))
+    h.update(_MAGIC)
+    return h.hexdigest()
+
+
+def compile_source(src, filename, path=None):
+    """compile(src, filename, 'exec'), reusing the code object from a previous run if src is unchanged"""
+    if _CACHE_DIR is None:
+        return compile(src, filename, 'exec')
+
+    if path is None:
+        path = filename
+
+    src_bytes = src.encode('utf8') if not isinstance(src, bytes) else src
+    header = marshal.dumps((len(src_bytes), hashlib.sha1(src_bytes).hexdigest()))
+    cache_file = os.path.join(_CACHE_DIR, _key(path, filename))
+
+    try:
+        with open(cache_file, 'rb') as f:
+            data = f.read()
+        if data.startswith(_MAGIC + header):
+            code = marshal.loads(data[len(_MAGIC) + len(header):])
+            _STATS['hits'] += 1
+            return code
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        pass
+
+    _STATS['misses'] += 1
+    code = compile(src, filename, 'exec')
+
+    try:
+        mkdir_p(_CACHE_DIR)
+        tmp = '{}.{}.tmp'.format(cache_file, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(_MAGIC + header + marshal.dumps(code))
+        os.rename(tmp, cache_file)
+    except (IOError, OSError):
+        # the cache is only an optimisation (and may be raced by parallel workers)
+        pass
+
+    return code
@@ -0,0 +1,176 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# outputs of run_command(..., cache=...) kept between runs, one JSON file per command in
+# .rubiks-cache/commands. An entry is used while it hasn't expired and the files the command
+# declared as its inputs are unchanged.
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from util import mkdir_p
+
+VERSION = 1
+
+_CACHE_DIR = None
+_REFRESH = False
+_STATS = {'hits': 0, 'misses': 0}
+_lock = threading.Lock()
+_hashes = {}
+
+
+def set_cache_dir(path, refresh=False):
+    global _CACHE_DIR, _REFRESH
+    _CACHE_DIR = path
+    _REFRESH = refresh
+
+
+def get_cache_dir():
+    return _CACHE_DIR
+
+
+def stats_line():
+    total = _STATS['hits'] + _STATS['misses']
+    if total == 0:
+        return 'command cache: no cached commands run'
+    return 'command cache: {} hits, {} misses'.format(_STATS['hits'], _STATS['misses'])
+
+
+def _count(what):
+    with _lock:
+        _STATS[what] += 1
+
+
+def hash_file(path):
+    """sha1 of the contents of the file (None if it can't be read), remembered for the rest of the run"""
+    with _lock:
+        if path in _hashes:
+            return _hashes[path]
+    try:
+        with open(path, 'rb') as f:
+            ret = hashlib.sha1(f.read()).hexdigest()
+    except (IOError, OSError):
+        ret = None
+    with _lock:
+        _hashes[path] = ret
+    return ret
+
+
+def entry_name(cmd):
+    """the name of the cache entry for a Command: everything but its inputs' contents"""
+    cache_env = list(map(lambda x: (x, os.environ.get(x)), sorted(cmd.cache_env or ())))
+    key = [VERSION, cmd.key(), cache_env, sorted(cmd.inputs or ())]
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf8')).hexdigest()
+
+
+def is_current(entry, now=None):
+    if now is None:
+        now = time.time()
+    if entry.get('version') != VERSION:
+        return False
+    if entry['expires'] is not None and entry['expires'] <= now:
+        return False
+    for path in entry['inputs']:
+        if hash_file(path) != entry['inputs'][path]:
+            return False
+    return True
+
+
+def get(cmd):
+    """the (output, rc) stored for the Command, or None if there isn't a current one"""
+    if _CACHE_DIR is None:
+        return None
+
+    if not _REFRESH:
+        try:
+            with open(os.path.join(_CACHE_DIR, entry_name(cmd) + '.json')) as f:
+                entry = json.load(f)
+            if is_current(entry):
+                _count('hits')
+                return (entry['output'], entry['rc'])
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            pass
+
+    _count('misses')
+    return None
+
+
+def put(cmd, output, rc):
+    if _CACHE_DIR is None:
+        return
+
+    now = time.time()
+    expires = None
+    if cmd.cache is not True:
+        expires = now + cmd.cache
+
+    inputs = {}
+    for path in sorted(cmd.inputs or ()):
+        inputs[path] = hash_file(path)
+
+    # the values of the environment aren't stored, as they may well be secrets
+    entry = {
+        'version': VERSION,
+        'cmd': list(cmd.key()[0]),
+        'cwd': cmd.cwd,
+        'env': sorted(set(cmd.env or ()) | set(cmd.cache_env or ())),
+        'inputs': inputs,
+        'created': now,
+        'expires': expires,
+        'output': output,
+        'rc': rc,
+        }
+
+    cache_file = os.path.join(_CACHE_DIR, entry_name(cmd) + '.json')
+    try:
+        mkdir_p(_CACHE_DIR)
+        tmp = '{}.{}.{}.tmp'.format(cache_file, os.getpid(), threading.current_thread().ident)
+        with open(tmp, 'w') as f:
+            f.write(json.dumps(entry, sort_keys=True))
+        os.rename(tmp, cache_file)
+    except (IOError, OSError):
+        # the cache is only an optimisation
+        pass
+
+
+def entries(path=None):
+    """(name, entry) for each entry in the cache directory, oldest first"""
+    if path is None:
+        path = _CACHE_DIR
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return []
+
+    ret = []
+    for fn in names:
+        if not fn.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(path, fn)) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            entry = None
+        if not isinstance(entry, dict) or entry.get('version') != VERSION:
+            entry = {'version': None, 'cmd': [], 'created': 0}
+        ret.append((fn[:-5], entry))
+
+    ret.sort(key=lambda x: (x[1].get('created', 0), x[0]))
+    return ret
+
+
+def purge(names, path=None):
+    if path is None:
+        path = _CACHE_DIR
+    for name in names:
+        try:
+            os.unlink(os.path.join(path, name + '.json'))
+        except OSError:
+            pass
@@ -5,24 +5,36 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import os
+
 from command import Command, RuntimeException
 from rubiks_repository import RubiksRepository
 from repository import RepositoryError
+import code_cache
+import command_cache
 import kube_loader
 import obj_registry
 import loader
+import source_cache
+import timing
 
 
 class CommandRepositoryBase(object):
     def get_repository(self, can_fail=False):
         r = None
         try:
-            r = RubiksRepository(cwd=self.global_args.base_directory)
+            with timing.phase('repository'):
+                r = RubiksRepository(cwd=self.global_args.base_directory)
             modules = [x.get_module_path() for x in r.get_modules()]
         except RepositoryError as e:
             if not can_fail:
                 raise RuntimeException(str(e))
-        kube_loader.load(*modules)
+        if r is not None:
+            if r.bytecode_cache:
+                code_cache.set_cache_dir(os.path.join(source_cache.cache_dir(r), 'bytecode'))
+            command_cache.set_cache_dir(os.path.join(source_cache.cache_dir(r), 'commands'))
+        with timing.phase('plugins'):
+            kube_loader.load(*modules)
         
         if r is not None:
             obj_registry.init(r.is_openshift)
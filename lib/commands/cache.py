@@ -0,0 +1,63 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+
+from .bases import CommandRepositoryBase
+from command import Command
+import command_cache
+
+
+def _duration(secs):
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if secs >= size:
+            return '{}{}'.format(int(secs // size), unit)
+    return '{}s'.format(int(max(secs, 0)))
+
+
+class Command_cache(Command, CommandRepositoryBase):
+    """list or purge the outputs of run_command(cache=...) kept between runs"""
+
+    def populate_args(self, parser):
+        parser.add_argument('action', nargs='?', choices=('list', 'purge'), default='list',
+                            help='list the cached commands (the default), or remove them')
+        parser.add_argument('-s', '--stale', action='store_true',
+                            help='Only the entries which would not be used (expired, or with changed inputs)')
+        parser.add_argument('-m', '--match', action='append',
+                            help='Only the entries whose command line contains this (may be specified more than once)')
+
+    def run(self, args):
+        self.get_repository()
+
+        now = time.time()
+        selected = []
+        for name, entry in command_cache.entries():
+            current = command_cache.is_current(entry, now)
+            if args.stale and current:
+                continue
+            cmdline = ' '.join(entry['cmd'])
+            if args.match is not None and not any(map(lambda x: x in cmdline, args.match)):
+                continue
+            selected.append((name, entry, current, cmdline))
+
+        if args.action == 'purge':
+            command_cache.purge(map(lambda x: x[0], selected))
+            print('removed {} cached command{}'.format(len(selected), '' if len(selected) == 1 else 's'))
+            return
+
+        for name, entry, current, cmdline in selected:
+            if entry['version'] is None:
+                print('{}  (unreadable or from another version of rubiks)'.format(name[:12]))
+                continue
+
+            if not current:
+                state = 'stale'
+            elif entry['expires'] is None:
+                state = 'no expiry'
+            else:
+                state = 'expires in {}'.format(_duration(entry['expires'] - now))
+            print('{}  {:>8} old  {:<16} {}'.format(name[:12], _duration(now - entry['created']), state, cmdline))
@@ -7,8 +7,14 @@ from __future__ import unicode_literals
 
 from command import Command
 from .bases import CommandRepositoryBase, LoaderBase
+import cProfile
+import code_cache
+import command_cache
 import load_python
+import obj_registry
+import parallel_loader
 import sys
+import timing
 
 
 class Command_generate(Command, LoaderBase, CommandRepositoryBase):
@@ -24,8 +30,52 @@ class Command_generate(Command, LoaderBase, CommandRepositoryBase):
                            help='Print out filepaths whose bytewise contents changed in this run')
         group.add_argument('-Y', '--yaml', action='store_true',
                            help='Print out filepaths whose parsed YAML contents changed in this run')
+        parser.add_argument('-i', '--incremental', action='store_true',
+                            help='Only rerun sources which (or whose imports) changed since the last ' +
+                                 'incremental run, keeping the previous outputs of the others')
+        parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help='Compile independent sources in this many worker processes')
+        parser.add_argument('--weak-registry', action='store_true',
+                            help="Don't keep objects alive once they're no longer referenced by anything " +
+                                 "(saves memory, but get_parents() only finds objects still referenced)")
+        parser.add_argument('--write-threads', type=int, default=8,
+                            help='Write the output files using this many threads')
+        parser.add_argument('--command-threads', type=int, default=8,
+                            help='Run the (distinct) commands from run_command() using this many threads')
+        parser.add_argument('--refresh-commands', action='store_true',
+                            help='Rerun the cached commands from run_command(cache=...), updating the cache')
+        parser.add_argument('--fsync', action='store_true',
+                            help='Flush each output file (and the directories they are in) to disk before finishing')
+        parser.add_argument('--profile', action='store_true',
+                            help='Report the time spent in each phase of the run and the slowest sources')
+        parser.add_argument('--profile-top', type=int, default=10, metavar='N',
+                            help='Number of sources to list in the --profile report')
+        parser.add_argument('--profile-pstats', metavar='FILE',
+                            help='Run under cProfile and write the stats (for pstats/snakeviz) to FILE')
+        parser.add_argument('--profile-trace', metavar='FILE',
+                            help='Write the phases to FILE as a chrome://tracing JSON trace')
 
     def run(self, args):
+        if args.profile or args.profile_trace is not None:
+            timing.enable(trace=args.profile_trace is not None)
+
+        profiler = None
+        if args.profile_pstats is not None:
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        try:
+            return self.do_generate(args)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(args.profile_pstats)
+            if args.profile:
+                timing.report(top=args.profile_top)
+            if args.profile_trace is not None:
+                timing.write_trace(args.profile_trace)
+
+    def do_generate(self, args):
         content_check = None
 
         if args.created:
@@ -38,12 +88,30 @@ class Command_generate(Command, LoaderBase, CommandRepositoryBase):
         self.loader_setup()
 
         r = self.get_repository()
+        if args.refresh_commands:
+            command_cache.set_cache_dir(command_cache.get_cache_dir(), refresh=True)
 
-        collection = load_python.PythonFileCollection(r, content_check)
+        if args.weak_registry:
+            obj_registry.obj_registry().set_weak()
 
-        collection.load_all_python(r.sources)
+        collection = load_python.PythonFileCollection(r, content_check, incremental=args.incremental,
+                                                      write_threads=args.write_threads, fsync=args.fsync,
+                                                      command_threads=args.command_threads)
+
+        try:
+            collection.load_all_python(r.sources, jobs=args.jobs)
+        except parallel_loader.WorkerFailed as e:
+            # the worker has already reported what went wrong
+            return e.rc
 
         files = collection.gen_output()
+        collection.debug(1, code_cache.stats_line())
+        collection.debug(1, command_cache.stats_line())
+
+        counts = obj_registry.obj_registry().get_counts()
+        collection.debug(1, 'object registry: {} objects retained'.format(sum(counts.values())))
+        for clsname in sorted(counts, key=lambda x: (-counts[x], x)):
+            collection.debug(1, '  {:>8} {}'.format(counts[clsname], clsname))
 
         for f in sorted(files):
             print(f)
@@ -8,6 +8,7 @@ from __future__ import unicode_literals
 import copy
 import traceback
 import sys
+import weakref
 from collections import OrderedDict
 from kube_help import KubeHelper
 
@@ -15,6 +16,64 @@ from kube_types import *
 from user_error import UserError, paths as user_error_paths
 
 
+if sys.version_info[0] == 2:
+    _immutable_types = (type(None), bool, int, long, float, str, unicode)
+else:
+    _immutable_types = (type(None), bool, int, float, str, bytes)
+
+
+if hasattr(sys, '_getframe'):
+    def _caller_location(depth=2):
+        # (filename, line, function) of the caller of our caller, as traceback.extract_stack() gives
+        # but without reading the source line from disk for every object
+        frame = sys._getframe(depth)
+        return (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+else:
+    def _caller_location(depth=2):
+        return tuple(traceback.extract_stack(limit=depth + 1)[0][0:3])
+
+
+_string_map = Map(String, String)
+_check_string_map = _string_map.checker()
+_is_none = lambda x: x is None
+
+# [object, cacheable, watched objects] for the objects being rendered, innermost last - the
+# sub-objects rendered while an object is rendered are what its rendering depends on
+_render_stack = []
+
+# id -> (object, validate() result, xform() result) for the objects validated during the current
+# top-level do_render(), so that sub-objects already checked by their parent's validate() aren't
+# validated (and transformed) again when they are rendered
+_render_pass = [None]
+
+
+def _copy_rendered(v):
+    # rendered output is only made of containers and values which are never changed in place
+    if isinstance(v, dict):
+        ret = v.__class__()
+        for k in v:
+            ret[k] = _copy_rendered(v[k])
+        return ret
+    if isinstance(v, list):
+        return list(map(_copy_rendered, v))
+    return v
+
+
+def _copy_data(v):
+    # deepcopy() which leaves sub-objects alone, so that they get rendered (and cached) as themselves
+    if isinstance(v, KubeBaseObj):
+        return v
+    cls = v.__class__
+    if cls in (list, tuple):
+        return cls(map(_copy_data, v))
+    if cls in (dict, OrderedDict):
+        ret = cls()
+        for k in v:
+            ret[k] = _copy_data(v[k])
+        return ret
+    return copy.deepcopy(v)
+
+
 def _rec_update_objs(obj):
     for k in obj._data:
         if isinstance(obj._data[k], KubeBaseObj):
@@ -82,9 +141,9 @@ class KubeBaseObj(object):
             kwargs[self.identifier] = args[0]
         self._data = self.__class__._find_defaults('_defaults')
 
-        self._caller_file, self._caller_line, self._caller_fn = traceback.extract_stack(limit=2)[0][0:3]
+        self._caller_file, self._caller_line, self._caller_fn = _caller_location()
 
-        for k in self.__class__._find_defaults('_map'):
+        for k in self.__class__._get_defaults('_map'):
             self._data[k] = None
 
         self.namespace = None
@@ -125,10 +184,11 @@ class KubeBaseObj(object):
                 self._data[k].update(kwargs[k])
 
         _rec_update_objs(self)
+        self._data_changed()
 
     def clone(self, *args, **kwargs):
         ret = self._clone()
-        ret._caller_file, ret._caller_line, ret._caller_fn = traceback.extract_stack(limit=2)[0][0:3]
+        ret._caller_file, ret._caller_line, ret._caller_fn = _caller_location()
         _rec_update_objs(self)
 
         if hasattr(self, 'identifier') and len(args) > 0 and self.identifier not in kwargs:
@@ -153,6 +213,7 @@ class KubeBaseObj(object):
                     ret._data[k] = {}
                 ret._data[k].update(kwargs[k])
 
+        ret._data_changed()
         return ret
 
     def _clone(self):
@@ -170,22 +231,45 @@ class KubeBaseObj(object):
 
         return ret
 
+    @classmethod
+    def _get_defaults(cls, clsmap):
+        # merged class metadata, computed once per class (not inherited, so subclasses from
+        # pluggable modules get their own) - this is shared, use _find_defaults() to modify it.
+        # The cache is never invalidated: _defaults, _map, _types etc. mustn't be changed on a
+        # class (or its bases) once it has been instantiated
+        cache = cls.__dict__.get('_defaults_cache', None)
+        if cache is None:
+            cache = {}
+            cls._defaults_cache = cache
+
+        if clsmap not in cache:
+            ret = {}
+            def _recurse(kls):
+                if not (len(kls.__bases__) == 0 or (len(kls.__bases__) == 1 and kls.__bases__[0] is object)):
+                    for c in kls.__bases__:
+                        _recurse(c)
+                if hasattr(kls, clsmap):
+                    ret.update(copy.deepcopy(getattr(kls, clsmap)))
+            _recurse(cls)
+            if hasattr(cls, 'identifier'):
+                if clsmap == '_types' and cls.identifier not in ret:
+                    ret[cls.identifier] = Identifier
+                elif clsmap == '_defaults':
+                    # we always set the identifier to be none as a default
+                    ret[cls.identifier] = None
+            cache[clsmap] = ret
+
+        return cache[clsmap]
+
     @classmethod
     def _find_defaults(cls, clsmap):
         ret = {}
-        def _recurse(kls):
-            if not (len(kls.__bases__) == 0 or (len(kls.__bases__) == 1 and kls.__bases__[0] is object)):
-                for c in kls.__bases__:
-                    _recurse(c)
-            if hasattr(kls, clsmap):
-                ret.update(copy.deepcopy(getattr(kls, clsmap)))
-        _recurse(cls)
-        if hasattr(cls, 'identifier'):
-            if clsmap == '_types' and cls.identifier not in ret:
-                ret[cls.identifier] = Identifier
-            elif clsmap == '_defaults':
-                # we always set the identifier to be none as a default
-                ret[cls.identifier] = None
+        defaults = cls._get_defaults(clsmap)
+        for k in defaults:
+            if isinstance(defaults[k], _immutable_types):
+                ret[k] = defaults[k]
+            else:
+                ret[k] = copy.deepcopy(defaults[k])
         return ret
 
     def set_namespace(self, name):
@@ -253,6 +337,31 @@ class KubeBaseObj(object):
 
         return cls._resolved_types
 
+    @classmethod
+    def resolve_checker(cls):
+        """
+        returns a function telling whether (transformed) data passes all the type checks done by
+        validate(), without building paths or messages for each attribute
+        """
+        if '_resolved_checker' not in cls.__dict__:
+            types = cls.resolve_types()
+            known = set(types)
+            known.update(cls._get_defaults('_map'))
+            plan = tuple(map(lambda k: (k, _is_none if types[k] is None else types[k].checker()), types))
+
+            def _check(data):
+                for k, check in plan:
+                    if not check(data.get(k, None)):
+                        return False
+                for k in data:
+                    if k not in known:
+                        return False
+                return True
+
+            cls._resolved_checker = staticmethod(_check)
+
+        return cls._resolved_checker
+
     @classmethod
     def get_child_types(cls):
         types = cls.resolve_types()
@@ -343,7 +452,7 @@ class KubeBaseObj(object):
         ret_help.class_identifier = cls.identifier if hasattr(cls, 'identifier') and cls.identifier is not None \
                                                  else None
 
-        mapping = cls._find_defaults('_map')
+        mapping = cls._get_defaults('_map')
         ret_help.class_mapping = {}
         for d in mapping:
             if mapping[d] not in ret_help.class_mapping:
@@ -372,6 +481,53 @@ class KubeBaseObj(object):
 
         return ret_help
 
+    def _data_changed(self, k=None):
+        # k is None if it could be any key which changed
+        self._drop_render_cache()
+        self._registry_changed(k)
+
+    def _drop_render_cache(self, keep_parents=False):
+        """
+        forget the cached rendering of this object and of everything which rendered it - after a
+        read (which may be followed by a change in place) the links to the parents are kept, so
+        that a later change still reaches them
+        """
+        todo = [self]
+        seen = set()
+        while len(todo) != 0:
+            obj = todo.pop()
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+
+            obj.__dict__.pop('_render_cache', None)
+            if keep_parents:
+                parents = obj.__dict__.get('_render_parents', None)
+            else:
+                parents = obj.__dict__.pop('_render_parents', None)
+            if parents is not None:
+                todo.extend(filter(lambda x: x is not None, map(lambda x: x(), parents.values())))
+
+    def _registry_changed(self, k=None):
+        # hook for the object registry to keep its indexes up to date
+        pass
+
+    def __getstate__(self):
+        # the render cache refers to other objects, so it isn't copied or pickled
+        state = self.__dict__.copy()
+        state.pop('_render_cache', None)
+        state.pop('_render_parents', None)
+        return state
+
+    def _render_state(self):
+        # the labels and annotations can be changed in place without us knowing, so they're
+        # compared on every cache hit (for this object and the sub-objects with metadata)
+        ns = self.__dict__.get('namespace', None)
+        return (dict(self.labels), dict(self.annotations), None if ns is None else ns.name)
+
+    def _add_render_parent(self, parent):
+        self.__dict__.setdefault('_render_parents', {})[id(parent)] = weakref.ref(parent)
+
     def has_child_object(self, obj):
         assert isinstance(obj, KubeBaseObj)
         for d in self._data:
@@ -394,48 +550,59 @@ class KubeBaseObj(object):
         for k in kwargs:
             if k in self._data:
                 self._data[k] = kwargs[k]
+                self._data_changed(k)
             else:
                 self.__setattr__(k, kwargs[k])
 
     def validate(self, path=None):
+        rpass = _render_pass[0]
+        if rpass is not None and id(self) in rpass:
+            return rpass[id(self)][1]
+
         if path is None:
             path = 'self'
 
         types = self.__class__.resolve_types()
-        mapping = self.__class__._find_defaults('_map')
+        mapping = self.__class__._get_defaults('_map')
 
-        if hasattr(self, 'labels'):
-            Map(String, String).check(self.labels, '{}.(labels)'.format(path))
-        if hasattr(self, 'annotations'):
-            Map(String, String).check(self.annotations, '{}.(annotations)'.format(path))
+        if hasattr(self, 'labels') and not _check_string_map(self.labels):
+            _string_map.check(self.labels, '{}.(labels)'.format(path))
+        if hasattr(self, 'annotations') and not _check_string_map(self.annotations):
+            _string_map.check(self.annotations, '{}.(annotations)'.format(path))
 
         if not self.check_namespace():
             raise UserError(KubeObjNoNamespace("No namespace attached to object at {}".format(path)))
 
         data = self.xform()
 
-        for k in types:
-            if k in data:
-                if types[k] is None and data[k] is not None:
-                    raise UserError(KeyError("{} is a removed attribute of {}".format(k, self.__class__.__name__)))
-                if types[k] is not None:
-                    types[k].check(data[k], path + '.' + k)
-            else:
-                if types[k] is not None:
-                    types[k].check(None, path + '.' + k)
+        # the full checks only run to find out what failed
+        if not self.__class__.resolve_checker()(data):
+            for k in types:
+                if k in data:
+                    if types[k] is None and data[k] is not None:
+                        raise UserError(KeyError("{} is a removed attribute of {}".format(k, self.__class__.__name__)))
+                    if types[k] is not None:
+                        types[k].check(data[k], path + '.' + k)
+                else:
+                    if types[k] is not None:
+                        types[k].check(None, path + '.' + k)
 
-        for k in data:
-            if k not in types and k not in mapping:
-                raise KubeTypeUnresolvable(
-                    "Unknown data key {} - no type information".format(k))
+            for k in data:
+                if k not in types and k not in mapping:
+                    raise KubeTypeUnresolvable(
+                        "Unknown data key {} - no type information".format(k))
 
         sav_data = self._data
         try:
             self._data = data
-            return self.do_validate()
+            ret = self.do_validate()
         finally:
             self._data = sav_data
 
+        if rpass is not None:
+            rpass[id(self)] = (self, ret, data)
+        return ret
+
     def render(self):
         raise NotImplementedError('method not implemented')
 
@@ -458,7 +625,7 @@ class KubeBaseObj(object):
         if kls is not self.__class__:
             return kls().parser(doc)
 
-        mapping = self.__class__._find_defaults('_map')
+        mapping = self.__class__._get_defaults('_map')
         self._data = self.__class__._find_defaults('_defaults')
         for k in mapping:
             self._data[k] = None
@@ -591,11 +758,12 @@ class KubeBaseObj(object):
         if hasattr(self, 'parser_fixup'):
             self.parser_fixup()
 
+        self._data_changed()
         return self
 
     def dump_obj(self, indent=0, include_defaults=False):
-        defaults = self.__class__._find_defaults('_defaults')
-        mapping = self.__class__._find_defaults('_map')
+        defaults = self.__class__._get_defaults('_defaults')
+        mapping = self.__class__._get_defaults('_map')
 
         def eline(obj, pfx, idt, idt_txt, comma):
             if isinstance(obj, KubeBaseObj):
@@ -691,7 +859,7 @@ class KubeBaseObj(object):
     def get_obj(self, prop, *args, **kwargs):
         types = self.__class__.resolve_types()
 
-        mapping = self.__class__._find_defaults('_map')
+        mapping = self.__class__._get_defaults('_map')
         if prop in mapping:
             prop = mapping[prop]
 
@@ -759,6 +927,7 @@ class KubeBaseObj(object):
 
         if self._data[prop] is None or rtype == 'obj':
             self._data[prop] = new
+            self._data_changed(prop)
             return result
 
         if rtype == 'list' and isinstance(self._data[prop], list):
@@ -768,10 +937,11 @@ class KubeBaseObj(object):
         else:
             raise UserError(TypeError("Expecting {} or None for property '{}' on {}".format(rtype, *fmt)))
 
+        self._data_changed(prop)
         return result
 
     def renderer(self, zlen_ok=(), order=(), mapping=None, return_none=False):
-        ret = copy.deepcopy(self._data)
+        ret = _copy_data(self._data)
 
         def _render(x):
             if isinstance(x, KubeBaseObj):
@@ -823,7 +993,7 @@ class KubeBaseObj(object):
 
     def xform(self):
         ret = {}
-        mapping = self.__class__._find_defaults('_map')
+        mapping = self.__class__._get_defaults('_map')
 
         for d in self._data:
             if hasattr(self, 'xf_{}'.format(d)):
@@ -843,11 +1013,77 @@ class KubeBaseObj(object):
         return ret
 
     def do_render(self):
+        top = _render_pass[0] is None
+        if top:
+            _render_pass[0] = {}
+        try:
+            cache = self.__dict__.get('_render_cache', None)
+            if cache is not None and (cache[2] != self._is_openshift or
+                                      list(map(lambda x: x._render_state(), cache[3])) != cache[4]):
+                cache = None
+
+            if cache is not None:
+                # unchanged since it was last validated and rendered
+                _render_pass[0].setdefault(id(self), (self, cache[1], None))
+                ret = _copy_rendered(cache[0])
+                cacheable = True
+                watched = cache[3]
+            else:
+                ret, cacheable, watched = self._render_uncached()
+
+            if len(_render_stack) != 0:
+                parent = _render_stack[-1]
+                if cacheable:
+                    self._add_render_parent(parent[0])
+                    parent[2].extend(watched)
+                else:
+                    parent[1] = False
+            return ret
+        finally:
+            if top:
+                _render_pass[0] = None
+
+    def _render_uncached(self):
+        frame = [self, not self._always_regenerate, [self] if self.has_metadata else []]
+
+        # sub-objects in _data can also be used by xform() or render() without being rendered
+        for v in self._data.values():
+            if isinstance(v, (list, tuple)):
+                subs = v
+            elif isinstance(v, dict):
+                subs = v.values()
+            else:
+                subs = (v,)
+            for x in subs:
+                if isinstance(x, KubeBaseObj):
+                    x._add_render_parent(self)
+                    if x._always_regenerate:
+                        frame[1] = False
+
+        _render_stack.append(frame)
+        try:
+            ret = self._do_render()
+        finally:
+            _render_stack.pop()
+
+        if frame[1] and ret is not None:
+            self.__dict__['_render_cache'] = [_copy_rendered(ret), _render_pass[0][id(self)][1], self._is_openshift,
+                                              frame[2], list(map(lambda x: x._render_state(), frame[2]))]
+        return ret, frame[1], frame[2]
+
+    def _do_render(self):
         self.validate()
+        # the xform() result from validate() is only used once, as render() may change it
+        rpass = _render_pass[0]
+        obj, valid, data = rpass[id(self)]
+        if data is None:
+            data = self.xform()
+        else:
+            rpass[id(self)] = (obj, valid, None)
 
         sav_data = self._data
         try:
-            self._data = self.xform()
+            self._data = data
             obj = self.render()
         finally:
             self._data = sav_data
@@ -900,7 +1136,11 @@ class KubeBaseObj(object):
 
     def __getattr__(self, k):
         if k != '_data' and hasattr(self, '_data') and k in self._data:
-            return self._data[k]
+            v = self._data[k]
+            if isinstance(v, (list, dict)):
+                # may well be changed in place
+                self._drop_render_cache(keep_parents=True)
+            return v
         if k.startswith('new_') and k[4:] in self._data:
             def get_prop(*args, **kwargs):
                 return self.get_obj(k[4:], *args, **kwargs)
@@ -917,11 +1157,13 @@ class KubeBaseObj(object):
         if k in ('_data',):
             pass
         elif k in self._data:
-            return self._data.__setitem__(k, v)
+            self._data.__setitem__(k, v)
+            return self._data_changed(k)
         if k in ('labels', 'annotations', 'namespace'):
+            self._drop_render_cache()
             return object.__setattr__(self, k, v)
 
-        fn = traceback.extract_stack(limit=2)[0][0]
+        fn = _caller_location()[0]
         for p in user_error_paths:
             if fn.startswith(p + '/'):
                 return object.__setattr__(self, k, v)
@@ -931,12 +1173,16 @@ class KubeBaseObj(object):
     def __getitem__(self, k):
         if not k in self._data:
             raise UserError(KeyError("key {} is not defined for {}".format(k, self.__class__.__name__)))
-        return self._data.__getitem__(k)
+        v = self._data.__getitem__(k)
+        if isinstance(v, (list, dict)):
+            self._drop_render_cache(keep_parents=True)
+        return v
 
     def __setitem__(self, k, v):
         if not k in self._data:
             raise UserError(KeyError("key {} is not defined for {}".format(k, self.__class__.__name__)))
-        return self._data.__setitem__(k, v)
+        self._data.__setitem__(k, v)
+        return self._data_changed(k)
 
 
 class KubeObj(KubeBaseObj):
@@ -6,10 +6,20 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import sys
+from collections import OrderedDict
 
 from user_error import UserError
 from var_types import VarEntity
 
+if sys.version_info[0] == 2:
+    _string_types = (str, unicode)
+    _integer_types = (int, long)
+else:
+    _string_types = (str,)
+    _integer_types = (int,)
+_number_types = _integer_types + (float,)
+_sized_types = _string_types + (list, tuple, dict, OrderedDict)
+
 
 class KubeObjValidationError(Exception):
     def __init__(self, obj, msg):
@@ -40,6 +50,7 @@ class KubeTypeValidationError(Exception):
 
 class KubeType(object):
     wrapper = False
+    _checker = None
 
     def __init__(self, *args):
         if self.wrapper:
@@ -82,6 +93,30 @@ class KubeType(object):
     def do_check(self, value, path):
         return False
 
+    def checker(self):
+        """
+        returns a function telling whether a value passes check(), without raising
+
+        The common cases are decided without building paths or messages, so a caller that gets
+        False back should call check() with the path to report the failure.
+        """
+        if self._checker is None:
+            self._checker = self.compile()
+        return self._checker
+
+    def compile(self):
+        return self._generic_checker()
+
+    def _generic_checker(self):
+        check = self.check
+
+        def _check(value):
+            try:
+                return bool(check(value))
+            except Exception:
+                return False
+        return _check
+
     def check(self, value, path=None):
         if isinstance(value, VarEntity):
             ret = self.do_check(value.validation_value(), path=path)
@@ -117,6 +152,21 @@ class Object(KubeType):
             return value.validate(path)
         return True
 
+    def compile(self):
+        if self.__class__ is not Object:
+            return self._generic_checker()
+        cls = self.cls
+        generic = self._generic_checker()
+
+        def _check(value):
+            if not isinstance(value, cls):
+                return generic(value)
+            try:
+                return not hasattr(value, 'validate') or bool(value.validate(None))
+            except Exception:
+                return False
+        return _check
+
 
 class Nullable(KubeType):
     validation_text = "Expected type or None"
@@ -127,6 +177,16 @@ class Nullable(KubeType):
             return True
         return self.check_wrap(value, path)
 
+    def compile(self):
+        if self.__class__ is not Nullable:
+            return self._generic_checker()
+        wrap = self.wrap.checker()
+        generic = self._generic_checker()
+
+        def _check(value):
+            return value is None or wrap(value) or generic(value)
+        return _check
+
 
 class Boolean(KubeType):
     validation_text = "Expected boolean"
@@ -134,6 +194,15 @@ class Boolean(KubeType):
     def do_check(self, value, path):
         return value is True or value is False
 
+    def compile(self):
+        if self.__class__ is not Boolean:
+            return self._generic_checker()
+        generic = self._generic_checker()
+
+        def _check(value):
+            return value is True or value is False or generic(value)
+        return _check
+
 
 class Enum(KubeType):
     def __init__(self, *args):
@@ -154,6 +223,16 @@ class Enum(KubeType):
     def do_check(self, value, path):
         return value in self.enums
 
+    def compile(self):
+        if self.__class__ is not Enum:
+            return self._generic_checker()
+        enums = self.enums
+        generic = self._generic_checker()
+
+        def _check(value):
+            return (value.__class__ in _string_types and value in enums) or generic(value)
+        return _check
+
 
 class Integer(KubeType):
     validation_text = "Expected integer"
@@ -165,6 +244,15 @@ class Integer(KubeType):
             return isinstance(value, (int, long))
         return isinstance(value, int)
 
+    def compile(self):
+        if self.__class__ is not Integer:
+            return self._generic_checker()
+        generic = self._generic_checker()
+
+        def _check(value):
+            return value.__class__ in _integer_types or generic(value)
+        return _check
+
 
 class Number(KubeType):
     validation_text = "Expected number"
@@ -176,6 +264,15 @@ class Number(KubeType):
             return isinstance(value, (int, long, float))
         return isinstance(value, (int, float))
 
+    def compile(self):
+        if self.__class__ is not Number:
+            return self._generic_checker()
+        generic = self._generic_checker()
+
+        def _check(value):
+            return value.__class__ in _number_types or generic(value)
+        return _check
+
 
 class Positive(KubeType):
     validation_text = "Expected positive"
@@ -184,6 +281,16 @@ class Positive(KubeType):
     def do_check(self, value, path):
         return self.check_wrap(value, path) and value >= 0
 
+    def compile(self):
+        if self.__class__ is not Positive:
+            return self._generic_checker()
+        wrap = self.wrap.checker()
+        generic = self._generic_checker()
+
+        def _check(value):
+            return (value.__class__ in _number_types and value >= 0 and wrap(value)) or generic(value)
+        return _check
+
 
 class NonZero(KubeType):
     validation_text = "Expected non-zero"
@@ -192,6 +299,16 @@ class NonZero(KubeType):
     def do_check(self, value, path):
         return self.check_wrap(value, path) and value != 0
 
+    def compile(self):
+        if self.__class__ is not NonZero:
+            return self._generic_checker()
+        wrap = self.wrap.checker()
+        generic = self._generic_checker()
+
+        def _check(value):
+            return (value.__class__ in _number_types and value != 0 and wrap(value)) or generic(value)
+        return _check
+
 
 class String(KubeType):
     validation_text = "Expected string"
@@ -201,6 +318,15 @@ class String(KubeType):
             return isinstance(value, basestring)
         return isinstance(value, str)
 
+    def compile(self):
+        if self.__class__ is not String:
+            return self._generic_checker()
+        generic = self._generic_checker()
+
+        def _check(value):
+            return value.__class__ in _string_types or generic(value)
+        return _check
+
 
 class SurgeSpec(KubeType):
     validation_text = "Expected surge/unavailable type ie integer or percent"
@@ -325,6 +451,17 @@ class Identifier(String):
                 return False
         return True
 
+    def compile(self):
+        if self.__class__ is not Identifier:
+            return self._generic_checker()
+        id_chars = frozenset('abcdefghijklmnopqrstuvwxyz0123456789.-')
+        generic = self._generic_checker()
+
+        def _check(value):
+            return (value.__class__ in _string_types and 0 < len(value) <= 253 and id_chars.issuperset(value)) or \
+                generic(value)
+        return _check
+
 
 class CaseIdentifier(Identifier):
     validation_text = "Identifiers should be <253 chars and alphanum or . or -"
@@ -409,6 +546,16 @@ class NonEmpty(KubeType):
     def do_check(self, value, path):
         return self.check_wrap(value, path) and len(value) != 0
 
+    def compile(self):
+        if self.__class__ is not NonEmpty:
+            return self._generic_checker()
+        wrap = self.wrap.checker()
+        generic = self._generic_checker()
+
+        def _check(value):
+            return (value.__class__ in _sized_types and len(value) != 0 and wrap(value)) or generic(value)
+        return _check
+
 
 class OneOf(KubeType):
     def __init__(self, *types):
@@ -440,6 +587,18 @@ class OneOf(KubeType):
         raise UserError(KubeTypeValidationError(value, self.name(), path,
                                                 "couldn't match any possible types"))
 
+    def compile(self):
+        if self.__class__ is not OneOf:
+            return self._generic_checker()
+        # only the first type can be tried on its own: check() stops at errors which aren't
+        # validation failures, so a later type passing doesn't mean the whole check would
+        first = self.types[0].checker()
+        generic = self._generic_checker()
+
+        def _check(value):
+            return first(value) or generic(value)
+        return _check
+
 
 class List(KubeType):
     validation_text = "Expecting list"
@@ -464,6 +623,16 @@ class List(KubeType):
 
         return True
 
+    def compile(self):
+        if self.__class__ is not List:
+            return self._generic_checker()
+        wrap = self.wrap.checker()
+        generic = self._generic_checker()
+
+        def _check(value):
+            return (value.__class__ in (list, tuple) and all(map(wrap, value))) or generic(value)
+        return _check
+
 
 class Map(KubeType):
     def __init__(self, key, value):
@@ -493,3 +662,19 @@ class Map(KubeType):
             self.value.check(value[k], path='{}[{}]'.format(path, k))
 
         return True
+
+    def compile(self):
+        if self.__class__ is not Map:
+            return self._generic_checker()
+        key = self.key.checker()
+        val = self.value.checker()
+        generic = self._generic_checker()
+
+        def _check(value):
+            if isinstance(value, dict):
+                for k in value:
+                    if not key(k) or not val(value[k]):
+                        return generic(value)
+                return True
+            return generic(value)
+        return _check
@@ -7,12 +7,14 @@ from __future__ import unicode_literals
 
 import base64
 import json
+import multiprocessing.pool
 import os
 import subprocess
 import sys
 import traceback
 
 from user_error import UserError
+import command_cache
 import kube_yaml
 import var_types
 
@@ -78,8 +80,99 @@ class CommandRuntimeException(Exception):
     pass
 
 
+# results of the commands run so far in this run, keyed by Command.key()
+_command_results = {}
+
+
+def _run_command(key):
+    cmd, cwd, env_clear, extra_env = key
+
+    env = {}
+    if not env_clear:
+        env.update(os.environ)
+    env.update(extra_env)
+
+    try:
+        p = subprocess.Popen(list(cmd), close_fds=True, shell=False, cwd=cwd, env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        return (None, None, e)
+
+    (out, err) = p.communicate()
+
+    err = err.decode('utf8')
+    if len(err.strip()) != 0:
+        print(err.rstrip(), file=sys.stderr)
+
+    return (out.decode('utf8'), p.returncode, None)
+
+
+def _run_cached(cmd):
+    if cmd.cache:
+        ret = command_cache.get(cmd)
+        if ret is not None:
+            return (ret[0], ret[1], None)
+
+    ret = _run_command(cmd.key())
+
+    # failures are never kept, they may well be transient
+    if cmd.cache and ret[2] is None and ret[1] == 0:
+        command_cache.put(cmd, ret[0], ret[1])
+    return ret
+
+
+def find_commands(obj, found=None):
+    """the Commands in a rendered object, which will be run when its YAML is generated"""
+    if found is None:
+        found = []
+    if isinstance(obj, Command):
+        found.append(obj)
+    elif isinstance(obj, var_types.VarEntity):
+        for v in obj.__dict__.values():
+            find_commands(v, found)
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            find_commands(v, found)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            find_commands(v, found)
+    return found
+
+
+def run_commands(commands, threads=1):
+    """
+    run the commands not yet run (each distinct one only once) before the YAML is generated, on
+    a pool of threads as they're mostly waiting on other processes
+    """
+    keys = []
+    todo = []
+    for c in commands:
+        key = c.key()
+        if key not in _command_results and key not in keys:
+            keys.append(key)
+            todo.append(c)
+
+    if threads > 1 and len(todo) > 1:
+        pool = multiprocessing.pool.ThreadPool(min(threads, len(todo)))
+        try:
+            results = pool.map(_run_cached, todo)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = list(map(_run_cached, todo))
+
+    _command_results.update(zip(keys, results))
+    return len(todo)
+
+
+def clear_command_results():
+    _command_results.clear()
+
+
 class Command(var_types.VarEntity):
-    def init(self, cmd, cwd=None, env_clear=False, env=None, good_rc=None, rstrip=False, eol=False):
+    def init(self, cmd, cwd=None, env_clear=False, env=None, good_rc=None, rstrip=False, eol=False,
+             cache=None, inputs=None, cache_env=None):
         self.cmd = cmd
         self.cwd = cwd
         self.env_clear = env_clear
@@ -87,33 +180,29 @@ class Command(var_types.VarEntity):
         self.good_rc = good_rc
         self.rstrip = rstrip
         self.eol = eol
+        self.cache = cache
+        self.inputs = inputs
+        self.cache_env = cache_env
         self.tb = traceback.extract_stack()
 
+    def key(self):
+        env = ()
+        if self.env is not None:
+            env = tuple(sorted(map(lambda e: (e, str(self.env[e])), self.env)))
+        return (tuple(map(str, self.cmd)), self.cwd, bool(self.env_clear), env)
+
     def to_string(self):
         if self._in_validation:
             return "command_output"
 
-        env = {}
-        if not self.env_clear:
-            env.update(os.environ)
-        if self.env is not None:
-            for e in self.env:
-                env[e] = str(self.env[e])
+        key = self.key()
+        if key not in _command_results:
+            _command_results[key] = _run_cached(self)
+        (out, rc, e) = _command_results[key]
 
-        try:
-            p = subprocess.Popen(map(str, self.cmd), close_fds=True, shell=False, cwd=self.cwd, env=env,
-                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except OSError as e:
+        if e is not None:
             raise UserError(CommandRuntimeException("Command {} didn't run: {}: {}".format(self.cmd[0], e.__class__.__name__, str(e))), tb=self.tb)
 
-        (out, err) = p.communicate()
-
-        out = out.decode('utf8')
-        err = err.decode('utf8')
-
-        if len(err.strip()) != 0:
-            print(err.rstrip(), file=sys.stderr)
-
         if self.rstrip:
             out = out.rstrip()
         if self.eol and (out == '' or out[-1] != '\n'):
@@ -123,4 +212,4 @@ class Command(var_types.VarEntity):
             return out
 
         raise UserError(CommandRuntimeException("Command {} exited with code rc={}".format(
-                                                    self.cmd[0], p.returncode)), tb=self.tb)
+                                                    self.cmd[0], rc)), tb=self.tb)
@@ -6,15 +6,11 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from collections import OrderedDict
+import os
 import sys
 import yaml
 from var_types import VarEntity
 
-try:
-    from io import StringIO
-except ImportError:
-    from StringIO import StringIO
-
 try:
     _ = basestring
 except NameError:
@@ -27,17 +23,29 @@ __all__ = ['quoted', 'literal', 'yaml_safe_dump', 'yaml_load']
 
 
 class FakeStringIO(object):
+    # the emitter writes a token at a time, so the text is only joined up at the end (adding to a
+    # VarEntity copies it, which made building the value as we went quadratic)
     def __init__(self, t=''):
-        self.t = t
+        self.chunks = [t]
 
     def write(self, text):
-        self.t = self.t + text
+        self.chunks.append(text)
 
     def flush(self):
         pass
 
     def get_value(self):
-        return self.t
+        ret = ''
+        text = []
+        for c in self.chunks:
+            if isinstance(c, VarEntity):
+                ret = ret + ''.join(text) + c
+                text = []
+            else:
+                text.append(c)
+        if len(text) != 0:
+            ret = ret + ''.join(text)
+        return ret
 
 
 class BlockRepresenter(yaml.representer.BaseRepresenter):
@@ -122,7 +130,7 @@ yaml.add_representer(OrderedDict, ordered_dict_presenter, Dumper=BlockDumper)
 yaml.add_representer(OrderedDict, ordered_dict_presenter, Dumper=SafeDumper)
 
 
-def var_entity_presenter(dumper, data):
+def set_var_entity_renderer(data):
     def representer(val):
         return yaml.dump(val,
                          indent=data.indent,
@@ -130,6 +138,10 @@ def var_entity_presenter(dumper, data):
                          default_flow_style=False,
                          Dumper=StringDumper)
     data.renderer = representer
+
+
+def var_entity_presenter(dumper, data):
+    set_var_entity_renderer(data)
     if hasattr(dumper, 'represent_unicode'):
         return dumper.represent_unicode(data)
     else:
@@ -139,7 +151,254 @@ yaml.add_multi_representer(VarEntity, var_entity_presenter, Dumper=BlockDumper)
 yaml.add_multi_representer(VarEntity, var_entity_presenter, Dumper=SafeDumper)
 
 
+_TAG_STR = 'tag:yaml.org,2002:str'
+_TAG_INT = 'tag:yaml.org,2002:int'
+_TAG_BOOL = 'tag:yaml.org,2002:bool'
+_TAG_NULL = 'tag:yaml.org,2002:null'
+_TAG_FLOAT = 'tag:yaml.org,2002:float'
+
+# length of the tags as the emitter would abbreviate them (it counts them towards simple keys)
+_TAG_LENGTHS = {_TAG_STR: 5, _TAG_INT: 5, _TAG_BOOL: 6, _TAG_NULL: 6, _TAG_FLOAT: 7}
+
+_LINE_BREAKS = "\u000a\u000d\u001c\u001d\u001e\u0085\u2028\u2029"
+
+if sys.version_info[0] == 2:
+    _text_type = unicode
+    _int_types = (int, long)
+else:
+    _text_type = str
+    _int_types = (int,)
+
+# (tag, value) -> (analysis, whether the value resolves to tag when plain, style from BlockRepresenter)
+_scalar_cache = {}
+
+
+class FastEmitterFallback(Exception):
+    pass
+
+
+class FastSafeDumper(SafeDumper):
+    """
+    Writes the same output as SafeDumper (with default_flow_style=False and allow_unicode=True)
+    for trees of dict, OrderedDict, list, strings, numbers, booleans, None and VarEntity, going
+    straight from the data to the emitter's writers rather than through the representer,
+    serializer and event queue. Anything else raises FastEmitterFallback.
+    """
+    def __init__(self, stream):
+        SafeDumper.__init__(self, stream, default_flow_style=False, allow_unicode=True)
+        self.seen = set()
+
+    def emit_documents(self, documents):
+        first = True
+        for doc in documents:
+            # anything (other than a scalar) used twice in a document would get an anchor
+            self.seen.clear()
+            if not first:
+                self.write_indent()
+                self.write_indicator('---', True)
+            first = False
+            self.emit_node(doc, root=True)
+            self.write_indent()
+            self.flush_stream()
+
+        if self.open_ended:
+            self.write_indicator('...', True)
+            self.write_indent()
+        self.flush_stream()
+
+    def check_seen(self, data):
+        if id(data) in self.seen:
+            raise FastEmitterFallback()
+        self.seen.add(id(data))
+
+    def emit_node(self, data, root=False, sequence=False, mapping=False, simple_key=False):
+        self.root_context = root
+        self.sequence_context = sequence
+        self.mapping_context = mapping
+        self.simple_key_context = simple_key
+
+        cls = data.__class__
+        if cls is dict or cls is OrderedDict:
+            self.check_seen(data)
+            items = list(data.items())
+            if cls is dict:
+                try:
+                    items = sorted(items)
+                except TypeError:
+                    pass
+            if len(items) == 0:
+                self.write_indicator('{', True, whitespace=True)
+                self.write_indicator('}', False)
+            else:
+                self.emit_block_mapping(items)
+        elif cls is list:
+            self.check_seen(data)
+            if len(data) == 0:
+                self.write_indicator('[', True, whitespace=True)
+                self.write_indicator(']', False)
+            else:
+                self.emit_block_sequence(data)
+        elif isinstance(data, VarEntity):
+            self.check_seen(data)
+            self.emit_var_entity(data)
+        else:
+            self.increase_indent(flow=True)
+            self.emit_scalar(data)
+            self.indent = self.indents.pop()
+
+    def emit_block_mapping(self, items):
+        self.increase_indent(flow=False)
+        for k, v in items:
+            self.write_indent()
+            if self.check_simple_key_value(k):
+                self.emit_node(k, mapping=True, simple_key=True)
+                self.write_indicator(':', False)
+            else:
+                self.write_indicator('?', True, indention=True)
+                self.emit_node(k, mapping=True)
+                self.write_indent()
+                self.write_indicator(':', True, indention=True)
+            self.emit_node(v, mapping=True)
+        self.indent = self.indents.pop()
+
+    def emit_block_sequence(self, data):
+        self.increase_indent(flow=False, indentless=(self.mapping_context and not self.indention))
+        for item in data:
+            self.write_indent()
+            self.write_indicator('-', True, indention=True)
+            self.emit_node(item, sequence=True)
+        self.indent = self.indents.pop()
+
+    def emit_var_entity(self, data):
+        # as VarEntityEmitter.process_scalar, the value is only turned into text when written out
+        set_var_entity_renderer(data)
+        self.increase_indent(flow=True)
+        data.indent = self.indent
+        text = ''
+        if not self.whitespace:
+            text = ' '
+            self.column += 1
+        self.column += 1
+        self.stream.write(text + data)
+        self.whitespace = False
+        self.indention = False
+        self.indent = self.indents.pop()
+
+    def scalar_info(self, data):
+        cls = data.__class__
+        if cls is _text_type:
+            tag, value = _TAG_STR, data
+        elif cls is bool:
+            tag, value = _TAG_BOOL, 'true' if data else 'false'
+        elif cls in _int_types:
+            if cls is not int:
+                # python 2 longs aren't exempt from aliasing
+                raise FastEmitterFallback()
+            tag, value = _TAG_INT, _text_type(data)
+        elif data is None:
+            tag, value = _TAG_NULL, 'null'
+        elif cls is float:
+            tag, value = _TAG_FLOAT, self.represent_float(data).value
+        elif cls is str:
+            # python 2 byte strings
+            try:
+                tag, value = _TAG_STR, data.decode('ascii')
+            except UnicodeDecodeError:
+                raise FastEmitterFallback()
+        else:
+            raise FastEmitterFallback()
+
+        if cls is not _text_type or (value, tag) not in _scalar_cache:
+            if sys.version_info[0] == 2 and any(map(lambda c: c > '\x7f', value)):
+                # python 2 writes utf-8 encoded bytes here
+                raise FastEmitterFallback()
+            style = None
+            if tag == _TAG_STR and value != '' and value.strip('0123456789') == '':
+                style = "'"
+            else:
+                for c in _LINE_BREAKS:
+                    if c in value:
+                        style = '|'
+                        break
+            implicit = self.resolve(yaml.nodes.ScalarNode, value, (True, False)) == tag
+            info = (self.analyze_scalar(value), implicit, style)
+            if cls is not _text_type or len(value) > 200:
+                return tag, info
+            if len(_scalar_cache) > 10000:
+                _scalar_cache.clear()
+            _scalar_cache[(value, tag)] = info
+        return tag, _scalar_cache[(value, tag)]
+
+    def check_simple_key_value(self, data):
+        if isinstance(data, VarEntity):
+            raise FastEmitterFallback()
+        if data.__class__ in (dict, OrderedDict, list):
+            return len(data) == 0
+        tag, (analysis, _, _) = self.scalar_info(data)
+        return _TAG_LENGTHS[tag] + len(analysis.scalar) < 128 and not analysis.empty and not analysis.multiline
+
+    def emit_scalar(self, data):
+        tag, (analysis, implicit, style) = self.scalar_info(data)
+
+        # as Emitter.choose_scalar_style, in block context
+        simple_key = self.simple_key_context
+        if not style and implicit and not (simple_key and (analysis.empty or analysis.multiline)) and \
+                analysis.allow_block_plain:
+            style = ''
+        elif style == '|' and not simple_key and analysis.allow_block:
+            pass
+        elif (not style or style == "'") and analysis.allow_single_quoted and \
+                not (simple_key and analysis.multiline):
+            style = "'"
+        else:
+            style = '"'
+
+        if not ((style == '' and implicit) or (style != '' and tag == _TAG_STR)):
+            # would need an explicit tag
+            raise FastEmitterFallback()
+
+        text = analysis.scalar
+        split = not simple_key
+        if style == '':
+            if text and ' ' not in text:
+                if self.root_context:
+                    self.open_ended = True
+                if not self.whitespace:
+                    text = ' ' + text
+                self.column += len(text)
+                self.stream.write(text)
+                self.whitespace = False
+                self.indention = False
+            else:
+                self.write_plain(text, split)
+        elif style == "'":
+            self.write_single_quoted(text, split)
+        elif style == '|':
+            self.write_literal(text)
+        else:
+            self.write_double_quoted(text, split)
+
+
+def _fast_dump(documents):
+    stream = FakeStringIO()
+    try:
+        FastSafeDumper(stream).emit_documents(documents)
+    except FastEmitterFallback:
+        return None
+    return stream.get_value()
+
+
+def _fast_ok(args, kwargs):
+    return len(args) == 1 and set(kwargs.keys()) <= set(('default_flow_style',)) and \
+        kwargs.get('default_flow_style', False) is False
+
+
 def yaml_safe_dump(*args, **kwargs):
+    if _fast_ok(args, kwargs):
+        ret = _fast_dump((args[0],))
+        if ret is not None:
+            return ret
+
     stream = FakeStringIO()
     kwargs['stream'] = stream
     kwargs['default_flow_style'] = False
@@ -149,6 +408,11 @@ def yaml_safe_dump(*args, **kwargs):
     return stream.get_value()
 
 def yaml_safe_dump_all(*args, **kwargs):
+    if _fast_ok(args, kwargs):
+        ret = _fast_dump(args[0])
+        if ret is not None:
+            return ret
+
     stream = FakeStringIO()
     kwargs['stream'] = stream
     kwargs['default_flow_style'] = False
@@ -167,12 +431,74 @@ def yaml_dump(*args, **kwargs):
     return stream.get_value()
 
 
+def _import_installed():
+    # the vendored yaml package shadows any installed PyYAML, so import the installed one on its
+    # own (with sys.modules/sys.path swapped out for the duration, as its libyaml binding imports
+    # "yaml" itself) and keep it only if it was built with libyaml. The two never share classes:
+    # documents are parsed and constructed entirely by the installed package.
+    if yaml.__with_libyaml__:
+        return yaml
+
+    def ours(name):
+        return name in ('yaml', '_yaml') or name.startswith('yaml.')
+
+    vendored = os.path.dirname(os.path.dirname(os.path.realpath(yaml.__file__)))
+    saved_modules = dict(filter(lambda x: ours(x[0]), sys.modules.items()))
+    saved_path = sys.path
+    try:
+        for k in saved_modules:
+            del sys.modules[k]
+        sys.path = list(filter(lambda x: x != '' and os.path.realpath(x) != vendored, sys.path))
+        try:
+            installed = __import__('yaml')
+        except Exception:
+            return None
+        if not getattr(installed, '__with_libyaml__', False):
+            return None
+        return installed
+    finally:
+        sys.path = saved_path
+        for k in list(filter(ours, sys.modules)):
+            del sys.modules[k]
+        sys.modules.update(saved_modules)
+
+_libyaml = _import_installed()
+have_libyaml = _libyaml is not None
+
+if have_libyaml:
+    class CLoader(_libyaml.cyaml.CParser, _libyaml.constructor.Constructor, _libyaml.resolver.Resolver):
+        def __init__(self, stream):
+            _libyaml.cyaml.CParser.__init__(self, stream)
+            _libyaml.constructor.Constructor.__init__(self)
+            _libyaml.resolver.Resolver.__init__(self)
+
+    # newer PyYAML versions return timezone-aware timestamps, keep to what the bundled one does
+    CLoader.add_constructor('tag:yaml.org,2002:timestamp',
+                            getattr(yaml.constructor.SafeConstructor.construct_yaml_timestamp, '__func__',
+                                    yaml.constructor.SafeConstructor.construct_yaml_timestamp))
+
+    Loader = CLoader
+else:
+    Loader = yaml.loader.Loader
+
+
 def yaml_load(string):
     if sys.version_info[0] == 2:
         string = unicode(string)
-    return yaml.load(StringIO(string))
+    if have_libyaml:
+        try:
+            return yaml.load(string, Loader=Loader)
+        except _libyaml.YAMLError:
+            # let the bundled parser produce the error (and its usual message)
+            pass
+    return yaml.load(string, Loader=yaml.loader.Loader)
 
 def yaml_load_all(string):
     if sys.version_info[0] == 2:
         string = unicode(string)
-    return yaml.load_all(StringIO(string))
+    if have_libyaml:
+        try:
+            return list(yaml.load_all(string, Loader=Loader))
+        except _libyaml.YAMLError:
+            pass
+    return yaml.load_all(string, Loader=yaml.loader.Loader)
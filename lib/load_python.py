@@ -20,6 +20,9 @@ from obj_registry import obj_registry, get_ns
 from user_error import UserError, user_originated, handle_user_error
 from output import RubiksOutputError, OutputCollection
 from lookup import Resolver
+from source_cache import SourceCache, load_deps
+import parallel_loader
+import timing
 from util import mkdir_p
 
 import kube_objs
@@ -57,11 +60,28 @@ class PythonFileCollection(loader.Loader):
         except KeyError:
             return None
 
-    def __init__(self, repository, content_check=None):
+    def __init__(self, repository, content_check=None, incremental=False, write_threads=1, fsync=False,
+                 command_threads=1):
         loader.Loader.__init__(self, repository)
-        self.outputs = OutputCollection(self, repository, content_check=content_check)
+        self.command_threads = command_threads
+        self.outputs = OutputCollection(self, repository, content_check=content_check,
+                                        write_threads=write_threads, fsync=fsync)
         self.all_sources = None
         self.current_context = []
+        self.current_file = None
+        self.inputs = {}
+        self.volatile = set()
+        self.loaded = []
+        self.cluster_restrict = {}
+
+        self.source_cache = None
+        if incremental:
+            if self.outputs.uses_policybinding():
+                # PolicyBindings are aggregated over every source, so they can't be partially regenerated
+                print("WARN: incremental generation isn't possible with output_policybinding, "
+                      "regenerating everything", file=sys.stderr)
+            else:
+                self.source_cache = SourceCache(repository)
 
     def get_file_context(self, path):
         try:
@@ -103,13 +123,15 @@ class PythonFileCollection(loader.Loader):
 
         return self.all_sources
 
-    def load_all_python(self, basepath):
+    def load_all_python(self, basepath, jobs=1):
         extensions = self.__class__.get_python_file_type(None)
         good_ext = set()
         for ext in extensions:
             if extensions[ext].default_export_objects:
                 good_ext.add(ext)
 
+        todo = []
+        reused = []
         paths = self.find_all_source_files()
         for p in paths:
             if os.path.relpath(p.repo_rel_path, basepath).startswith('..'):
@@ -118,8 +140,61 @@ class PythonFileCollection(loader.Loader):
                 continue
             if p.extension not in good_ext:
                 continue
+            if self.source_cache is not None and self.source_cache.is_fresh(p.src_rel_path):
+                self.debug(1, 'reusing outputs of unchanged {}'.format(p.repo_rel_path))
+                self.outputs.reuse_outputs(self.source_cache.reuse(p.src_rel_path))
+                reused.append(p)
+                continue
+            todo.append(p)
+
+        if jobs > 1 and len(todo) != 0:
+            # the graph from the last incremental run (if any) keeps sources importing each other together
+            if self.source_cache is not None:
+                deps = self.source_cache.deps
+            else:
+                deps = load_deps(self.repository)
+            with timing.phase('compile (workers)'):
+                if parallel_loader.load_parallel(self, todo, jobs, deps=deps):
+                    todo = []
+
+        for p in todo:
             self.load_python(p)
 
+        self.rerun_shared(reused)
+
+    def rerun_shared(self, reused):
+        """
+        rerun the unchanged sources whose previous outputs would also be written by the sources which
+        were run (eg. a namespace used by both), until there are none left, so that shared files are
+        made from everything contributing to them and duplicate objects are found
+        """
+        while len(reused) != 0:
+            written = set()
+            for op in self.outputs.get_outputs():
+                written.update(self.outputs.get_paths(op))
+
+            rerun = list(filter(lambda p: any(map(lambda x: x[0] in written,
+                                                  self.source_cache.outputs[p.src_rel_path])), reused))
+            if len(rerun) == 0:
+                return
+
+            for p in rerun:
+                self.debug(1, 'rerunning unchanged {}, which shares outputs with a rerun source'.format(p.repo_rel_path))
+                reused.remove(p)
+                self.outputs.unreuse_outputs(self.source_cache.unreuse(p.src_rel_path))
+                self.load_python(p)
+
+    def get_file_clusters(self, path):
+        clusters = self.repository.get_clusters()
+        if path.full_path not in self.cluster_restrict:
+            return clusters
+        return list(filter(lambda x: x in self.cluster_restrict[path.full_path], clusters))
+
+    def splits_per_cluster(self, path):
+        python_loader = self.__class__.get_python_file_type(path.extension)
+        return python_loader is not None and issubclass(python_loader, PythonImportPerClusterFile) and \
+            len(self.repository.get_clusters()) > 1
+
     def load_python(self, path):
         if isinstance(path, loader.Path):
             pth = path
@@ -128,9 +203,18 @@ class PythonFileCollection(loader.Loader):
         self.debug(1, 'loading python {}'.format(pth.repo_rel_path))
 
         self.current_file = pth
+        self.loaded.append(pth)
         self.get_file_context(pth)
         self.current_file = None
 
+    def add_input(self, py_context, path):
+        if py_context.path.src_rel_path not in self.inputs:
+            self.inputs[py_context.path.src_rel_path] = set()
+        self.inputs[py_context.path.src_rel_path].add(path.src_rel_path)
+
+    def mark_volatile(self, py_context):
+        self.volatile.add(py_context.path.src_rel_path)
+
     def get_multi_python(self, py_context, pattern='*', basepath=None, **kwargs):
         extensions = self.__class__.get_python_file_type(None)
         ret = {}
@@ -203,7 +287,28 @@ class PythonFileCollection(loader.Loader):
         self.outputs.add_output(kobj)
 
     def gen_output(self):
-        return self.outputs.write_output()
+        with timing.phase('commands'):
+            kube_vartypes.run_commands(self.outputs.get_commands(), self.command_threads)
+        with timing.phase('output'):
+            ret = self.outputs.write_output()
+        if self.source_cache is not None:
+            deps = {}
+            for k in self.deps:
+                deps[k] = set(self.deps[k])
+            for k in self.inputs:
+                if k not in deps:
+                    deps[k] = set()
+                deps[k].update(self.inputs[k])
+
+            outputs = {}
+            for p in self.loaded:
+                outputs[p.src_rel_path] = set()
+            for src, out in self.outputs.get_produced():
+                if src in outputs:
+                    outputs[src].add(out)
+
+            self.source_cache.save(deps, self.volatile, outputs)
+        return ret
 
 
 class PythonBaseFile(object):
@@ -324,6 +429,9 @@ class PythonBaseFile(object):
                 raise
 
         def get_multi_python(pattern=None, basepath=None, **kwargs):
+            # the matched set of files isn't part of the dependency graph
+            self.collection().mark_volatile(self)
+
             nargs = {}
             nargs.update(self.default_import_args)
             nargs.update(kwargs)
@@ -369,12 +477,14 @@ class PythonBaseFile(object):
             tmp = list()
             for p in path:
               tmp.append(self.path.rel_path(p))
+              self.collection().add_input(self, tmp[-1])
 
             return Resolver(tmp, **kwargs)
 
         @_user_error
         def read_file(path, cant_read_ok=False):
             path = self.path.rel_path(path)
+            self.collection().add_input(self, path)
             try:
                 with open(path.full_path) as f:
                     return f.read()
@@ -386,6 +496,7 @@ class PythonBaseFile(object):
         @_user_error
         def list_dir(path, cant_read_ok=False):
             path = self.path.rel_path(path)
+            self.collection().mark_volatile(self)
             try:
                 return os.listdir(path.full_path)
             except:
@@ -398,21 +509,35 @@ class PythonBaseFile(object):
 
         def run_command(*cmd, **kwargs):
             args = {'cwd': None, 'env_clear': False, 'env': None, 'delay': True, 'ignore_rc': True,
-                    'rstrip': True, 'eol': False}
+                    'rstrip': True, 'eol': False, 'cache': None, 'inputs': None, 'cache_env': None}
             for k in kwargs:
                 if k not in args:
                     raise UserError(TypeError("{} isn't a valid argument to run_command()".format(k)))
             args.update(kwargs)
 
+            self.collection().mark_volatile(self)
+
             cwd = None
             if args['cwd'] is not None:
-                cwd = self.path.rel_path(args['cwd'])
+                cwd = self.path.rel_path(args['cwd']).full_path
+
+            cache = args['cache']
+            if cache is False:
+                cache = None
+            elif cache is not None and cache is not True:
+                if not isinstance(cache, (int, float)) or cache <= 0:
+                    raise UserError(ValueError("cache must be True or a number of seconds for run_command()"))
+
+            inputs = None
+            if args['inputs'] is not None:
+                inputs = list(map(lambda x: self.path.rel_path(x).full_path, args['inputs']))
 
             good_rc = None
             if not args['ignore_rc']:
                 good_rc = (0,)
             cmd_ent = kube_vartypes.Command(cmd, cwd=cwd, env_clear=args['env_clear'],
-                                            env=args['env'], good_rc=good_rc, rstrip=args['rstrip'], eol=args['eol'])
+                                            env=args['env'], good_rc=good_rc, rstrip=args['rstrip'], eol=args['eol'],
+                                            cache=cache, inputs=inputs, cache_env=args['cache_env'])
             if args['delay']:
                 return cmd_ent
             else:
@@ -521,6 +646,13 @@ class PythonBaseFile(object):
         return ret
 
     def do_compile(self, extra_context=None):
+        key = self.path.src_rel_path
+        if extra_context is not None and extra_context.get('current_cluster_name', None) is not None:
+            key = '{} [{}]'.format(key, extra_context['current_cluster_name'])
+        with timing.phase('compile', key):
+            return self._do_compile(extra_context)
+
+    def _do_compile(self, extra_context=None):
         self.debug(2, 'compiling python: {} ({})'.format(self.path.src_rel_path, self.path.full_path))
         mod = None
         savepath = sys.path
@@ -636,57 +768,61 @@ class PythonImportPerClusterFile(PythonBaseFile):
         else:
             self.fallback = False
             self.module = {}
-            for c in self.collection().repository.get_clusters():
-                this_cluster = self.collection().repository.get_cluster_info(c)
-                save_cluster = KubeBaseObj._default_cluster
-                res_save_cluster = Resolver.current_cluster
-
-                def get_valid_clusters(c):
-                    def valid_clusters(*clusters):
-                        if len(clusters) == 0:
-                            raise UserError(ValueError("Must specify at least one cluster"))
-                        all_clusters = tuple(self.collection().repository.get_clusters())
-                        for cc in clusters:
-                            if cc not in all_clusters:
-                                print("WARN: valid_clusters() called with unknown cluster name: " + cc,
-                                      file=sys.stderr)
-                        if c not in clusters:
-                            raise PythonStopCompile("stop")
-                    return valid_clusters
+            for c in self.collection().get_file_clusters(self.path):
+                self.compile_cluster(c)
+
+    def compile_cluster(self, c):
+        this_cluster = self.collection().repository.get_cluster_info(c)
+        save_cluster = KubeBaseObj._default_cluster
+        res_save_cluster = Resolver.current_cluster
+
+        def valid_clusters(*clusters):
+            if len(clusters) == 0:
+                raise UserError(ValueError("Must specify at least one cluster"))
+            all_clusters = tuple(self.collection().repository.get_clusters())
+            for cc in clusters:
+                if cc not in all_clusters:
+                    print("WARN: valid_clusters() called with unknown cluster name: " + cc,
+                          file=sys.stderr)
+            if c not in clusters:
+                raise PythonStopCompile("stop")
 
-                try:
-                    KubeBaseObj._default_cluster = this_cluster
-                    Resolver.current_cluster = this_cluster
-                    self.default_import_args = {'cluster': c}
-                    self.module[c] = self.do_compile({
-                        'current_cluster': this_cluster,
-                        'current_cluster_name': c,
-                        'valid_clusters': get_valid_clusters(c),
-                        })
-                finally:
-                    KubeBaseObj._default_cluster = save_cluster
-                    Resolver.current_cluster = res_save_cluster
+        try:
+            KubeBaseObj._default_cluster = this_cluster
+            Resolver.current_cluster = this_cluster
+            self.default_import_args = {'cluster': c}
+            self.module[c] = self.do_compile({
+                'current_cluster': this_cluster,
+                'current_cluster_name': c,
+                'valid_clusters': valid_clusters,
+                })
+        finally:
+            KubeBaseObj._default_cluster = save_cluster
+            Resolver.current_cluster = res_save_cluster
 
-    def get_module(self, **kwargs):
-        if self.fallback:
-            return self.module
+    def get_cluster_module(self, kwargs):
         if not 'cluster' in kwargs:
             raise loader.LoaderImportError("must specify 'cluster' param when importing .ekube or .ckube files")
+        if kwargs['cluster'] not in self.module and \
+                kwargs['cluster'] in self.collection().repository.get_clusters():
+            # only some clusters were compiled up front (see get_file_clusters())
+            self.compile_cluster(kwargs['cluster'])
         return self.module[kwargs['cluster']]
 
+    def get_module(self, **kwargs):
+        if self.fallback:
+            return self.module
+        return self.get_cluster_module(kwargs)
+
     def get_symnames(self, **kwargs):
         if self.fallback:
             return self.module.__dict__.keys()
-        if not 'cluster' in kwargs:
-            raise loader.LoaderImportError("must specify 'cluster' param when importing .ekube or .ckube files")
-        return self.module[kwargs['cluster']].__dict__.keys()
+        return self.get_cluster_module(kwargs).__dict__.keys()
 
     def get_symbol(self, symname, **kwargs):
         if self.fallback:
             return self.module.__dict__[symname]
-        if not 'cluster' in kwargs:
-            raise loader.LoaderImportError("must specify 'cluster' param when importing .ekube or .ckube files")
-        return self.module[kwargs['cluster']].__dict__[symname]
+        return self.get_cluster_module(kwargs).__dict__[symname]
 
 
 class PythonRunPerClusterFile(PythonImportPerClusterFile):
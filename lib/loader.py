@@ -234,19 +234,18 @@ class Loader(object):
 
     def add_dep(self, s_path, d_path=None):
         if hasattr(s_path, 'src_rel_path') and (d_path is None or hasattr(d_path, 'src_rel_path')):
-            if s_path.src_rel_path not in self.deps:
-                self.deps[s_path.src_rel_path] = set()
-            if d_path is not None:
-                self.debug(2, '{} depends on {}'.format(s_path, d_path))
-                self.deps[s_path.src_rel_path].add(d_path.src_rel_path)
-                self.check_deps()
+            s_key = s_path.src_rel_path
+            d_key = None if d_path is None else d_path.src_rel_path
         else:
-            if s_path.full_path not in self.deps:
-                self.deps[s_path.full_path] = set()
-            if d_path is not None:
-                self.debug(2, '{} depends on {}'.format(s_path, d_path))
-                self.deps[s_path.full_path].add(d_path.full_path)
-                self.check_deps()
+            s_key = s_path.full_path
+            d_key = None if d_path is None else d_path.full_path
+
+        if s_key not in self.deps:
+            self.deps[s_key] = set()
+        if d_key is not None and d_key not in self.deps[s_key]:
+            self.debug(2, '{} depends on {}'.format(s_path, d_path))
+            self.deps[s_key].add(d_key)
+            self.check_deps(s_key, d_key)
 
     def get_or_add_file(self, f_path, comp_context_obj, args):
         if f_path.full_path in self.files:
@@ -256,22 +255,54 @@ class Loader(object):
         self.files[f_path.full_path] = comp_context_obj(*args)
         return self.files[f_path.full_path]
 
-    def check_deps(self):
-        checked = set()
-
-        def _rec_check_deps(k, prev):
-            if prev is None:
-                prev = set()
-            if k not in self.deps:
-                return
-            for nk in self.deps[k]:
-                if nk in prev:
-                    raise LoaderLoopException('Loop detected: {} imports {}'.format(nk, k))
-                nprev = set((nk,))
-                nprev.update(prev)
-                _rec_check_deps(nk, nprev)
-                checked.add(nk)
-
-        for k in self.deps:
-            if k not in checked:
-                _rec_check_deps(k, None)
+    def check_deps(self, s_key=None, d_key=None):
+        if s_key is not None:
+            # the graph was acyclic before this edge was added, so only a path back from the
+            # destination to the source can close a loop
+            loop = self._find_path(d_key, s_key)
+            if loop is not None:
+                loop.insert(0, s_key)
+                raise LoaderLoopException('Loop detected: {}'.format(' imports '.join(loop)))
+            return
+
+        # full check: depth-first colouring of the whole graph
+        done = set()
+        for k in sorted(self.deps):
+            if k in done:
+                continue
+            stack = [(k, iter(sorted(self.deps.get(k, ()))))]
+            in_stack = [k]
+            on_stack = set(in_stack)
+            while len(stack) != 0:
+                node, children = stack[-1]
+                for nk in children:
+                    if nk in on_stack:
+                        loop = in_stack[in_stack.index(nk):]
+                        loop.append(nk)
+                        raise LoaderLoopException('Loop detected: {}'.format(' imports '.join(loop)))
+                    if nk not in done:
+                        stack.append((nk, iter(sorted(self.deps.get(nk, ())))))
+                        in_stack.append(nk)
+                        on_stack.add(nk)
+                        break
+                else:
+                    stack.pop()
+                    on_stack.discard(in_stack.pop())
+                    done.add(node)
+
+    def _find_path(self, start, end):
+        prev = {start: None}
+        todo = [start]
+        while len(todo) != 0:
+            k = todo.pop()
+            if k == end:
+                ret = []
+                while k is not None:
+                    ret.insert(0, k)
+                    k = prev[k]
+                return ret
+            for nk in self.deps.get(k, ()):
+                if nk not in prev:
+                    prev[nk] = k
+                    todo.append(nk)
+        return None
@@ -5,13 +5,21 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import copy
 import json
+import os
 import sys
 
 from kube_vartypes import Confidential
 from kube_yaml import yaml_load
 from loader import Path
 from user_error import UserError, handle_user_error
+import timing
+
+if sys.version_info[0] == 3:
+    basestring = str
+
+_MISSING = object()
 
 
 class InvalidKey(Exception):
@@ -43,25 +51,22 @@ class Resolver(object):
         self.has_gitcrypt = False
         self.path = pth
         self.data = dict()
+        self.index = dict()
         self.non_exist_ok = non_exist_ok
         self.git_crypt_ok = git_crypt_ok
         self.fail_ok = fail_ok
         self._load_files()
 
     def _load_files(self):
-        data = None
         for path in self.path:
             try:
-                with open(path.full_path, 'rb') as f:
-                    data = f.read()
+                (kind, doc, index) = _parse_file(path)
             except:
                 if not self.non_exist_ok:
                     raise
+                continue
 
-            if data is None:
-                return
-
-            if b'GITCRYPT' in data[0:10]:
+            if kind == 'gitcrypt':
                 if self.has_data:
                     raise ValueError("Mixed crypt and notcrypt data in lookup files")
 
@@ -73,30 +78,24 @@ class Resolver(object):
             if self.has_gitcrypt:
                 raise ValueError("Mixed crypt and notcrypt data in lookup files")
 
-            try:
-                data = data.decode('utf8')
-            except:
+            if kind == 'unicode':
                 if self.fail_ok:
-                    print("Can't parse {} as unicode, let alone JSON or YAML".format(path.hrepo_rel_path),
+                    print("Can't parse {} as unicode, let alone JSON or YAML".format(path.repo_rel_path),
                           file=sys.stderr)
                     return
-                raise
+                raise doc
 
-            try:
-                if data.lstrip().startswith('{') and data.rstrip().endswith('}'):
-                    self.data.update(json.loads(data))
-                    self.has_data = True
-                else:
-                    raise ValueError("not json")
-            except ValueError:
-                try:
-                    self.data.update(yaml_load(data))
-                    self.has_data = True
-                except:
-                    if self.fail_ok:
-                        print("Can't parse {} as JSON or YAML".format(path.repo_rel_path), file=sys.stderr)
-                    else:
-                        raise ValueError("Unparseable file " + path.repo_rel_path)
+            if kind == 'unparseable':
+                if self.fail_ok:
+                    print("Can't parse {} as JSON or YAML".format(path.repo_rel_path), file=sys.stderr)
+                    continue
+                raise ValueError("Unparseable file " + path.repo_rel_path)
+
+            # only the top level is copied, the rest is shared with other lookups of this file
+            # and copied by get_key() on the way out
+            self.data.update(doc)
+            self.index.update(index)
+            self.has_data = True
 
     def get_branches(self, path):
         try:
@@ -114,6 +113,12 @@ class Resolver(object):
         if path == '.':
             return tuple(sorted(self.data.keys()))
 
+        ctx = self._lookup(self._resolve_path(path))
+        if isinstance(ctx, dict):
+            return tuple(sorted(ctx.keys()))
+        elif ctx is not _MISSING:
+            return ()
+
         path_c = self._resolve_path(path).split('.')
         ctx = self.data
 
@@ -132,6 +137,21 @@ class Resolver(object):
         return ()
 
     def get_key(self, *args):
+        # the common case, where one of the paths is in the index. Otherwise go the long way
+        # round, for the default or the error
+        if self.has_data:
+            for arg in args:
+                ret = self._lookup(self._resolve_path(arg))
+                if ret is _MISSING or isinstance(ret, dict):
+                    continue
+                if self.is_confidential:
+                    return Confidential(str(ret))
+                if self.assert_type is not None and not isinstance(ret, self.assert_type):
+                    continue
+                if isinstance(ret, list):
+                    return copy.deepcopy(ret)
+                return ret
+
         e_txt = None
         for p in range(0, len(args)):
             last = False
@@ -168,6 +188,12 @@ class Resolver(object):
             return path
         return path.format(cluster=self.__class__.current_cluster.name)
 
+    def _lookup(self, path):
+        sub = self.index.get(path.partition('.')[0])
+        if sub is None:
+            return _MISSING
+        return sub.get(path, _MISSING)
+
     def _get_repo_rel_path(self):
         return ', '.join(map(lambda x: x.repo_rel_path, self.path))
 
@@ -198,4 +224,91 @@ class Resolver(object):
                 e_txt + "branch {} ({}) is not specific enough in {} (refers to branch not key)".format(
                     '.'.join(path_c), path, self._get_repo_rel_path()))
 
+        if isinstance(ctx, list):
+            return copy.deepcopy(ctx)
         return ctx
+
+
+# parsed lookup files (with their indexes), by (real) path, for as long as their mtime and
+# size stay the same
+_documents = {}
+
+
+def clear_cache():
+    _documents.clear()
+
+
+def _parse_file(path):
+    """
+    ('data', document, index), ('gitcrypt', None, None), ('unicode', exception, None) or
+    ('unparseable', None, None) for the file, raising an exception if it can't be read. The
+    document and index are shared, so mustn't be changed.
+    """
+    st = os.stat(path.full_path)
+    stamp = (st.st_mtime, st.st_size)
+
+    key = os.path.realpath(path.full_path)
+    cached = _documents.get(key)
+    if cached is not None and cached[0] == stamp:
+        timing.count('lookup cache hits')
+        return cached[1]
+
+    timing.count('lookup cache misses')
+    with timing.phase('lookup', path.repo_rel_path):
+        with open(path.full_path, 'rb') as f:
+            data = f.read()
+        ret = _parse(data)
+        if ret[0] == 'data':
+            ret = ret + (_flatten(ret[1]),)
+        else:
+            ret = ret + (None,)
+
+    _documents[key] = (stamp, ret)
+    return ret
+
+
+def _parse(data):
+    if b'GITCRYPT' in data[0:10]:
+        return ('gitcrypt', None)
+
+    try:
+        data = data.decode('utf8')
+    except UnicodeDecodeError as e:
+        return ('unicode', e)
+
+    try:
+        if data.lstrip().startswith('{') and data.rstrip().endswith('}'):
+            ret = json.loads(data)
+        else:
+            raise ValueError("not json")
+    except ValueError:
+        try:
+            ret = yaml_load(data)
+        except:
+            return ('unparseable', None)
+
+    if not isinstance(ret, dict):
+        return ('unparseable', None)
+    return ('data', ret)
+
+
+def _flatten(doc):
+    """
+    {top level key: {dotted path: value}} for every branch and leaf of the document, leaving
+    out the keys which can't be reached by a dotted path
+    """
+    ret = {}
+    for top in doc:
+        if not isinstance(top, basestring) or '.' in top:
+            continue
+        index = {}
+        todo = [(top, doc[top])]
+        while len(todo) != 0:
+            (path, value) = todo.pop()
+            index[path] = value
+            if isinstance(value, dict):
+                for k in value:
+                    if isinstance(k, basestring) and '.' not in k:
+                        todo.append((path + '.' + k, value[k]))
+        ret[top] = index
+    return ret
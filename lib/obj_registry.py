@@ -5,6 +5,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import weakref
+
 from user_error import UserError
 from kube_obj import KubeBaseObj, KubeObj
 
@@ -15,21 +17,118 @@ class RegistryStackError(Exception):
     pass
 
 
+class _StrongRef(object):
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __call__(self):
+        return self.obj
+
+
+class _Record(object):
+    __slots__ = ('ref', 'clsname', 'order', 'owner', 'indexed', 'pending', 'dirty', 'children')
+
+    def __init__(self, ref, clsname, order, owner):
+        self.ref = ref
+        self.clsname = clsname
+        self.order = order
+        self.owner = owner
+        self.indexed = None
+        self.pending = False
+        self.dirty = False
+        self.children = {}
+
+
 class ObjectRegistry(object):
     def __init__(self):
         self.registry = {}
-        self.id_registry = {}
+        self.records = {}
         self.classes = {}
         self.context_stack = []
+        self.count = 0
+
+        # with weak set, objects are only kept alive by the registry while the context they
+        # were created in is open (for default export) - namespaces are always kept
+        self.weak = False
+        self.dead = []
+
+        # identifier index: objects are (re)indexed lazily, after they were added or their
+        # identifier changed - objects with no identifier yet stay pending
+        self.id_registry = {}
+        self.id_pending = {}
+
+        # child -> parent index, updated lazily from the objects whose _data changed
+        self.parents = {}
+        self.dirty = []
+
+    def set_weak(self, weak=True):
+        self.weak = weak
+
+    def _ref(self, obj):
+        if self.weak:
+            from kube_objs import Namespace
+            if not isinstance(obj, Namespace):
+                oid = id(obj)
+                return weakref.ref(obj, lambda r: self.dead.append(oid))
+        return _StrongRef(obj)
+
+    def _reap(self):
+        while len(self.dead) != 0:
+            oid = self.dead.pop()
+            rec = self.records.pop(oid, None)
+            if rec is None:
+                continue
+            del self.registry[rec.clsname][oid]
+            if rec.indexed is not None:
+                index = self.id_registry[rec.clsname]
+                index[rec.indexed].remove(rec)
+                if len(index[rec.indexed]) == 0:
+                    del index[rec.indexed]
+            for c in rec.children:
+                self.parents.get(c, {}).pop(oid, None)
+            self.parents.pop(oid, None)
+
+    def _get_record(self, obj):
+        if len(self.dead) != 0:
+            self._reap()
+        rec = self.records.get(id(obj), None)
+        if rec is None or rec.ref() is not obj:
+            return None
+        return rec
 
     def add(self, obj):
+        if len(self.dead) != 0:
+            self._reap()
+
         cls = obj.__class__
         clsname = self.get_class_name(cls)
         if clsname not in self.registry:
             self.registry[clsname] = {}
+        owner = None
         if len(self.context_stack) != 0:
             self.context_stack[-1][1].append(obj)
-        self.registry[clsname][id(obj)] = obj
+            owner = self.context_stack[-1][0]
+
+        ref = self._ref(obj)
+        self.records[id(obj)] = _Record(ref, clsname, self.count, owner)
+        self.registry[clsname][id(obj)] = ref
+        self.count += 1
+        self.changed(obj)
+
+    def changed(self, obj, key=None):
+        rec = self._get_record(obj)
+        if rec is None:
+            return
+
+        if not rec.dirty:
+            rec.dirty = True
+            self.dirty.append(rec)
+
+        if not rec.pending and (key is None or key == getattr(obj.__class__, 'identifier', None)):
+            rec.pending = True
+            self.id_pending.setdefault(rec.clsname, []).append(rec)
 
     def new_context(self, identifier):
         self.context_stack.append((identifier, []))
@@ -45,6 +144,23 @@ class ObjectRegistry(object):
         objs = self.context_stack.pop()
         return objs[1]
 
+    def get_owner(self, obj):
+        # identifier of the context the object was created in, or None
+        rec = self._get_record(obj)
+        if rec is None:
+            return None
+        return rec.owner
+
+    def get_counts(self):
+        """number of objects currently held per class"""
+        if len(self.dead) != 0:
+            self._reap()
+        ret = {}
+        for clsname in self.registry:
+            if len(self.registry[clsname]) != 0:
+                ret[clsname] = len(self.registry[clsname])
+        return ret
+
     def get_class_name(self, cls):
         if cls.__name__ in self.classes:
             if self.classes[cls.__name__][0] is cls:
@@ -60,42 +176,91 @@ class ObjectRegistry(object):
             self.classes[cls.__name__] = [cls]
             return cls.__name__
 
+    def _index_ids(self, clsname, id_fld):
+        pending = self.id_pending.get(clsname, None)
+        if not pending:
+            return
+
+        if clsname not in self.id_registry:
+            self.id_registry[clsname] = {}
+        index = self.id_registry[clsname]
+
+        still_pending = []
+        for rec in pending:
+            obj = rec.ref()
+            if obj is None:
+                continue
+
+            if rec.indexed is not None:
+                index[rec.indexed].remove(rec)
+                if len(index[rec.indexed]) == 0:
+                    del index[rec.indexed]
+                rec.indexed = None
+
+            curr_id = getattr(obj, id_fld) if hasattr(obj, id_fld) else None
+            if curr_id is None:
+                still_pending.append(rec)
+                continue
+
+            rec.pending = False
+            rec.indexed = curr_id
+            index.setdefault(curr_id, []).append(rec)
+
+        self.id_pending[clsname] = still_pending
+
     def get_id(self, cls, identifier):
         if not hasattr(cls, 'identifier'):
             return None
 
-        id_fld = cls.identifier
+        if len(self.dead) != 0:
+            self._reap()
+
         clsname = self.get_class_name(cls)
 
         if clsname not in self.registry:
             return None
 
-        if clsname in self.id_registry and identifier in self.id_registry[clsname]:
-            return self.id_registry[clsname][identifier]
-        elif clsname not in self.id_registry:
-            self.id_registry[clsname] = {}
+        self._index_ids(clsname, cls.identifier)
 
-        ret = []
-        self.id_registry[clsname] = {}
-        for obj in self.registry[clsname].values():
-            if hasattr(obj, id_fld) and getattr(obj, id_fld) is not None:
-                curr_id = getattr(obj, id_fld)
-                if curr_id not in self.id_registry[clsname]:
-                    self.id_registry[clsname][curr_id] = []
-                self.id_registry[clsname][curr_id].append(obj)
-                if curr_id == identifier:
-                    ret.append(obj)
-
-        if len(ret) == 0:
+        ret = self.id_registry.get(clsname, {}).get(identifier, None)
+        if not ret:
             return None
-        return ret
+        return list(map(lambda x: x.ref(), sorted(ret, key=lambda x: x.order)))
+
+    def _index_parents(self):
+        for rec in self.dirty:
+            obj = rec.ref()
+            rec.dirty = False
+            if obj is None:
+                continue
+
+            new = {}
+            for v in obj._data.values():
+                if isinstance(v, KubeBaseObj):
+                    new[id(v)] = True
+
+            oid = id(obj)
+            for c in rec.children:
+                if c not in new:
+                    self.parents.get(c, {}).pop(oid, None)
+            for c in new:
+                if c not in rec.children:
+                    self.parents.setdefault(c, {})[oid] = rec
+            rec.children = new
+
+        self.dirty = []
 
     def get_parents(self, obj):
+        if len(self.dead) != 0:
+            self._reap()
+        self._index_parents()
+
+        parent_types = tuple(obj._parent_types.values())
         ret = []
-        for cls in obj._parent_types:
-            for robj in self.registry[self.get_class_name(cls)].values():
-                if robj.has_child_object(obj):
-                    ret.append(robj)
+        for rec in sorted(self.parents.get(id(obj), {}).values(), key=lambda x: x.order):
+            robj = rec.ref()
+            if robj is not None and robj.__class__ in parent_types and robj.has_child_object(obj):
+                ret.append(robj)
         return ret
 
 _REG = ObjectRegistry()
@@ -107,6 +272,12 @@ def add_obj(self):
 KubeBaseObj.add_obj = add_obj
 
 
+def data_changed(self, k=None):
+    return _REG.changed(self, k)
+
+KubeBaseObj._registry_changed = data_changed
+
+
 def get_ns(self, name):
     try:
         from kube_objs import Namespace
@@ -139,3 +310,11 @@ def init(is_openshift):
 
 def obj_registry():
     return _REG
+
+
+def set_obj_registry(reg):
+    """use another registry from now on (eg. a fresh one in tests), returning the previous one"""
+    global _REG
+    ret = _REG
+    _REG = reg
+    return ret
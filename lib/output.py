@@ -10,9 +10,13 @@ import sys
 import weakref
 
 import kube_objs
+import kube_vartypes
 import var_types
 from kube_obj import KubeObj
 from kube_yaml import yaml_safe_dump, yaml_safe_dump_all, yaml_load
+from output_manifest import OutputManifest
+from output_writer import OutputWriter
+import timing
 from util import mkdir_p
 from user_error import UserError
 
@@ -22,13 +26,17 @@ class RubiksOutputError(Exception):
 
 
 class OutputCollection(object):
-    def __init__(self, loader, repository, content_check=None):
+    def __init__(self, loader, repository, content_check=None, write_threads=1, fsync=False):
         self.repository = repository
         self.clusterless = {}
         self.clustered = {}
         self.content_check = content_check
+        self.write_threads = write_threads
+        self.fsync = fsync
         self.cluster_mode = (len(self.repository.get_clusters()) != 0)
         self.loader = weakref.ref(loader)
+        self.reused = []
+        self.produced = []
         self.set_confidentiality_mode()
 
     def set_confidentiality_mode(self):
@@ -61,6 +69,38 @@ class OutputCollection(object):
     def debug(self, *args, **kwargs):
         self.loader().debug(*args, **kwargs)
 
+    def uses_policybinding(self):
+        if self.repository.output_policybinding:
+            return True
+        return any(map(lambda c: self.repository.get_cluster_info(c).output_policybinding,
+                       self.repository.get_clusters()))
+
+    def reuse_outputs(self, outputs):
+        self.reused.extend(outputs)
+
+    def unreuse_outputs(self, outputs):
+        for o in outputs:
+            self.reused.remove(o)
+
+    def get_paths(self, op):
+        """the paths (relative to the output directory) that op is written to"""
+        filename = op.filename_conversion(op.identifier) + '.yaml'
+        if op.uses_namespace:
+            filename = os.path.join(op.namespace_name, filename)
+
+        if not self.cluster_mode:
+            return [filename]
+        if op.cluster is not None:
+            return [os.path.join(op.cluster, filename)]
+        return list(map(lambda c: os.path.join(c, filename), self.repository.get_clusters()))
+
+    def get_produced(self):
+        ret = []
+        for op, relpath in self.produced:
+            for src in op.sources:
+                ret.append((src, (relpath, op.is_confidential)))
+        return ret
+
     def add_output(self, kobj):
         if not isinstance(kobj, KubeObj):
             raise TypeError("argument to output should be a KubeObj derivative")
@@ -74,35 +114,97 @@ class OutputCollection(object):
         if not op.is_namespace:
             self.add_output(op.kobj.namespace)
 
-        if cluster is not None and cluster not in self.clustered:
-            self.clustered[cluster] = {}
+        outputs = self._get_ns_outputs(op)
 
-        if cluster is None:
-            outputs = self.clusterless
-        else:
-            outputs = self.clustered[cluster]
+        self.check_for_dupes(op)
 
-        if op.namespace_name not in outputs:
-            outputs[op.namespace_name] = {}
-        outputs = outputs[op.namespace_name]
+        if op.identifier not in outputs:
+            outputs[op.identifier] = op
+
+        current_file = getattr(self.loader(), 'current_file', None)
+        if current_file is not None:
+            outputs[op.identifier].sources.add(current_file.src_rel_path)
+
+        outputs[op.identifier].render()
+
+    def merge_output(self, kobj, cluster, cached_obj, sources, origin=None, owner=None):
+        # add an already rendered object compiled elsewhere (eg. in a worker process)
+        op = OutputMember(self, kobj, cluster, content_check=self.content_check)
+        op.origin = origin
+        op.owner = owner
+        op.cached_obj = cached_obj
+
+        outputs = self._get_ns_outputs(op)
 
         self.check_for_dupes(op)
 
         if op.identifier not in outputs:
             outputs[op.identifier] = op
+        outputs[op.identifier].sources.update(sources)
 
-        outputs[op.identifier].render()
+        if op.is_namespace:
+            # namespace labels and annotations are merged from every worker
+            outputs[op.identifier].render()
+
+    def _get_ns_outputs(self, op):
+        if op.cluster is not None and op.cluster not in self.clustered:
+            self.clustered[op.cluster] = {}
+
+        if op.cluster is None:
+            outputs = self.clusterless
+        else:
+            outputs = self.clustered[op.cluster]
+
+        if op.namespace_name not in outputs:
+            outputs[op.namespace_name] = {}
+        return outputs[op.namespace_name]
+
+    def get_outputs(self):
+        ret = []
+        for ns in self.clusterless:
+            ret.extend(self.clusterless[ns].values())
+        for c in self.clustered:
+            for ns in self.clustered[c]:
+                ret.extend(self.clustered[c][ns].values())
+        return ret
+
+    def get_commands(self):
+        ret = []
+        for op in self.get_outputs():
+            kube_vartypes.find_commands(op.cached_obj, ret)
+        return ret
+
+    def get_written(self):
+        ret = set(map(lambda x: x[0], self.reused))
+        ret.update(map(lambda x: x[1], self.produced))
+        return ret
 
     def write_output(self):
         self.base = os.path.join(self.repository.basepath, self.repository.outputs)
         self.debug(2, "writing output to {}".format(self.base))
+        manifest = OutputManifest(self.repository)
         if self.cluster_mode:
-            return self._write_output_clustered()
-        return self._write_output_clusterless()
+            changed = self._write_output_clustered()
+        else:
+            changed = self._write_output_clusterless()
+
+        written = self.get_written()
+        removed = manifest.prune(self.base, written)
+        for p in removed:
+            self.debug(1, "removed stale output {}".format(p))
+        manifest.save(written)
+
+        if self.content_check is not None:
+            changed.extend(removed)
+        return changed
+
+    def _add_reused(self, confidential):
+        for relpath, is_confidential in self.reused:
+            confidential.add_file(ReusedOutputFile(os.path.join(self.base, relpath), is_confidential))
 
     def _write_output_clustered(self):
-        changed = []
-        with self.confidential(self.base) as confidential:
+        with OutputWriter(self.write_threads, self.fsync) as writer, self.confidential(self.base) as confidential:
+            self._add_reused(confidential)
             for c in self.repository.get_clusters():
                 path = os.path.join(self.base, c)
                 is_openshift = self.repository.is_openshift or self.repository.get_cluster_info(c).is_openshift
@@ -118,10 +220,10 @@ class OutputCollection(object):
                     if c in self.clustered and ns in self.clustered[c]:
                         outputs.extend(self.clustered[c][ns].values())
 
-                    changed.extend(self._write_namespace(outputs, path, confidential,
-                                                         is_openshift=is_openshift,
-                                                         uses_policybinding=uses_policybinding,
-                                                         ))
+                    self._write_namespace(outputs, path, confidential, writer,
+                                          is_openshift=is_openshift,
+                                          uses_policybinding=uses_policybinding,
+                                          )
 
                 if not c in self.clustered:
                     continue
@@ -130,27 +232,32 @@ class OutputCollection(object):
                     if ns in ns_done:
                         continue
 
-                    changed.extend(self._write_namespace(self.clustered[c][ns].values(), path, confidential,
-                                                         is_openshift=is_openshift,
-                                                         uses_policybinding=uses_policybinding,
-                                                         ))
-        return changed
+                    self._write_namespace(self.clustered[c][ns].values(), path, confidential, writer,
+                                          is_openshift=is_openshift,
+                                          uses_policybinding=uses_policybinding,
+                                          )
+            return writer.finish()
 
     def _write_output_clusterless(self):
-        changed = []
         mkdir_p(self.base)
-        with self.confidential(self.base) as confidential:
+        with OutputWriter(self.write_threads, self.fsync) as writer, self.confidential(self.base) as confidential:
+            self._add_reused(confidential)
             for ns in self.clusterless:
-                changed.extend(self._write_namespace(self.clusterless[ns].values(), self.base,
-                                                     confidential, 
-                                                     is_openshift=self.repository.is_openshift,
-                                                     uses_policybinding=self.repository.output_policybinding,
-                                                     ))
-        return changed
-
-    def _write_namespace(self, outputs, path, confidential, is_openshift=False, uses_policybinding=False):
-        changed = []
-
+                self._write_namespace(self.clusterless[ns].values(), self.base, confidential, writer,
+                                      is_openshift=self.repository.is_openshift,
+                                      uses_policybinding=self.repository.output_policybinding,
+                                      )
+            return writer.finish()
+
+    def _write_file(self, op, path, confidential, writer):
+        data = op.prepare_file(path)
+        if data is not None:
+            writer.write(op, data)
+            # namespaces are written once per cluster by the same op, so note where it went this time
+            self.produced.append((op, os.path.relpath(os.path.join(op.filedir, op.filename), self.base)))
+        confidential.add_file(op)
+
+    def _write_namespace(self, outputs, path, confidential, writer, is_openshift=False, uses_policybinding=False):
         outputs_ns = tuple(filter(lambda x: x.uses_namespace, outputs))
         outputs_nons = tuple(filter(lambda x: not x.uses_namespace, outputs))
 
@@ -183,24 +290,18 @@ class OutputCollection(object):
                                   )
                 op.kobj.set_namespace(rolebindings[0].namespace.name)
                 op.namespace_name = rolebindings[0].namespace.name
+                for rb in rolebindings:
+                    op.sources.update(rb.sources)
                 op.render()
                 stage_2.append(op)
 
             for op in stage_2:
-                p = op.write_file(path)
-                if p is not None:
-                    changed.append(p)
-                confidential.add_file(op)
+                self._write_file(op, path, confidential, writer)
 
         for op in outputs_nons:
             if op.is_namespace:
                 continue
-            p = op.write_file(path)
-            if p is not None:
-                changed.append(p)
-            confidential.add_file(op)
-
-        return changed
+            self._write_file(op, path, confidential, writer)
 
     def _get_openshift_objs(self, ns_op):
         new_op = [ns_op]
@@ -249,6 +350,9 @@ class OutputCollection(object):
         op.render()
         new_op.append(op)
 
+        for op in new_op[1:]:
+            op.sources.update(ns_op.sources)
+
         return new_op
 
     def check_for_dupes(self, op):
@@ -314,6 +418,9 @@ class OutputMember(object):
         self.cluster = cluster
         self.content_check = content_check
         self.coll = weakref.ref(coll)
+        self.sources = set()
+        self.origin = None
+        self.owner = None
 
         self.is_namespace = isinstance(kobj, kube_objs.Namespace)
         self.is_confidential = False
@@ -343,10 +450,18 @@ class OutputMember(object):
             # and this allows us to be cleverer about the pull secrets
             return self.kobj._data['dockers'] == obj.kobj._data['dockers']
 
-        return self.kobj is obj.kobj
+        if self.kobj is obj.kobj:
+            return True
+
+        if self.origin != obj.origin and self.owner is not None and self.owner == obj.owner:
+            # the same source was compiled separately by two workers, so this is the same object
+            return self.cached_obj == obj.cached_obj
+
+        return False
 
     def render(self):
-        self.cached_obj = self.kobj.do_render()
+        with timing.phase('render'):
+            self.cached_obj = self.kobj.do_render()
 
     def has_data(self):
         if not hasattr(self, 'cached_obj'):
@@ -354,27 +469,36 @@ class OutputMember(object):
         return self.cached_obj is not None
 
     def yaml(self):
-        if isinstance(self.cached_obj, list):
-            self.cached_yaml = yaml_safe_dump_all(self.cached_obj, default_flow_style=False)
-        else:
-            self.cached_yaml = yaml_safe_dump(self.cached_obj, default_flow_style=False)
+        with timing.phase('yaml'):
+            if isinstance(self.cached_obj, list):
+                self.cached_yaml = yaml_safe_dump_all(self.cached_obj, default_flow_style=False)
+            else:
+                self.cached_yaml = yaml_safe_dump(self.cached_obj, default_flow_style=False)
 
     def filename_conversion(self, filename):
         return filename.replace(':', '_')
 
     def write_file(self, path):
+        data = self.prepare_file(path)
+        if data is None:
+            return None
+
+        mkdir_p(self.filedir)
+        return self.store_file(self.filedir, data)
+
+    def prepare_file(self, path):
+        """work out where this goes and what to write there (the file itself is written by store_file())"""
         if not hasattr(self, 'cached_obj') or self.kobj._always_regenerate:
             self.render()
 
         if self.cached_obj is None:
-            return
+            return None
 
         if not hasattr(self, 'cached_yaml'):
             self.yaml()
 
         if self.uses_namespace:
             path = os.path.join(path, self.namespace_name)
-            mkdir_p(path)
 
         self.filedir = path
         self.filename = self.filename_conversion(self.identifier) + '.yaml'
@@ -392,29 +516,68 @@ class OutputMember(object):
         if self.is_confidential:
             self.debug(3, "  file {}/{} is confidential".format(self.filedir, self.filename))
 
+        return content if isinstance(content, bytes) else content.encode('utf8')
+
+    def store_file(self, path, data, fsync=False):
+        """write data out to path unless it's already there, returning the file if the content_check says it changed"""
+        # NB: this may be run on another thread, by which time the same object (eg. a namespace in
+        # clustered mode) may have been prepared again for somewhere else, so self.filedir isn't used
+        with timing.phase('write'):
+            return self._store_file(path, data, fsync)
+
+    def _store_file(self, path, data, fsync):
+        target = os.path.join(path, self.filename)
+
+        # read the existing file at most once: to see if it needs writing at all (only worth it if
+        # the size matches) and for the -c/-C checks
+        try:
+            size = os.path.getsize(target)
+        except OSError:
+            size = None
+
+        existing = None
+        if size is not None and (size == len(data) or self.content_check == 'yaml'):
+            try:
+                with open(target, 'rb') as f:
+                    existing = f.read()
+            except (IOError, OSError):
+                size = None
+
+        if existing == data:
+            self.debug(3, "  file {}/{} is unchanged".format(path, self.filename))
+            return None
+
         changed = False
-        if self.content_check is not None and self.content_check in ('contents', 'yaml', 'exists'):
+        if size is None:
+            changed = self.content_check in ('contents', 'yaml', 'exists')
+        elif self.content_check == 'contents':
+            changed = True
+        elif self.content_check == 'yaml':
             try:
-                with open(os.path.join(path, self.filename), 'rb') as f:
-                    if self.content_check == 'contents':
-                        if content != f.read().decode('utf8'):
-                            changed = True
-                    elif self.content_check == 'yaml':
-                        if yaml_load(content) != yaml_load(f.read().decode('utf8')):
-                            changed = True
+                changed = yaml_load(data.decode('utf8')) != yaml_load(existing.decode('utf8'))
             except:
                 changed = True
 
-        with open(os.path.join(path, '.' + self.identifier + '.tmp'), 'w') as f:
-            f.write(content)
-        os.rename(os.path.join(path, '.' + self.identifier + '.tmp'),
-                  os.path.join(path, self.filename))
+        tmp = os.path.join(path, '.' + self.identifier + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.rename(tmp, target)
 
         if changed:
-            return os.path.join(path, self.filename)
+            return target
         return None
 
 
+class ReusedOutputFile(object):
+    """stand-in for an output file left in place by an incremental run"""
+    def __init__(self, path, is_confidential):
+        self.filedir, self.filename = os.path.split(path)
+        self.is_confidential = is_confidential
+
+
 class ConfidentialOutput(object):
     def __init__(self, basedir):
         pass
@@ -429,7 +592,8 @@ class ConfidentialOutput(object):
         return self
 
     def __exit__(self, etyp, evalue, etb):
-        self.generate()
+        with timing.phase('confidential'):
+            self.generate()
         return False
 
 
@@ -441,7 +605,8 @@ class ConfidentialOutputHidden(ConfidentialOutput):
 
     def __exit__(self, etyp, evalue, etb):
         var_types.VarContext.show_confidential = self.show_confidential
-        self.generate()
+        with timing.phase('confidential'):
+            self.generate()
         return False
 
 
@@ -0,0 +1,79 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+
+from source_cache import cache_dir
+from util import mkdir_p
+
+
+class OutputManifest(object):
+    """record of the files written to the output directory, so the ones no longer produced can be removed"""
+
+    version = 1
+    filename = 'outputs.json'
+
+    def __init__(self, repository):
+        self.path = os.path.join(cache_dir(repository), self.filename)
+        self.outputs = repository.outputs
+        self.files = None
+
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+
+        # if the output directory moved, the old files aren't ours to remove any more
+        if not isinstance(data, dict) or data.get('version') != self.version or data.get('outputs') != self.outputs:
+            return
+
+        self.files = set(data['files'])
+
+    def prune(self, base, files):
+        """remove the files written last time which aren't in files, returning their paths"""
+        if self.files is None:
+            return []
+
+        removed = []
+        for relpath in sorted(self.files.difference(files)):
+            if os.path.isabs(relpath) or relpath.split(os.sep)[0] == '..':
+                continue
+
+            path = os.path.join(base, relpath)
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            removed.append(path)
+
+            # tidy up the namespace (and cluster) directories left empty
+            d = os.path.dirname(relpath)
+            while d != '':
+                try:
+                    os.rmdir(os.path.join(base, d))
+                except OSError:
+                    break
+                d = os.path.dirname(d)
+
+        return removed
+
+    def save(self, files):
+        data = {
+            'version': self.version,
+            'outputs': self.outputs,
+            'files': sorted(files),
+            }
+
+        mkdir_p(os.path.split(self.path)[0])
+        with open(self.path + '.tmp', 'w') as f:
+            f.write(json.dumps(data, indent=1, sort_keys=True))
+        os.rename(self.path + '.tmp', self.path)
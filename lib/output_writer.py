@@ -0,0 +1,75 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from multiprocessing.pool import ThreadPool
+import os
+
+from util import mkdir_p
+
+
+class OutputWriter(object):
+    """
+    Writes out prepared OutputMembers on a pool of threads, as with lots of files on a slow disk
+    the time goes on waiting for syscalls. Each directory is only created (and checked for) once.
+    The changed paths and the first error are reported in the order the files were queued,
+    whatever order the writes finished in.
+    """
+    def __init__(self, threads=1, fsync=False):
+        self.fsync = fsync
+        self.dirs = set()
+        self.results = []
+        self.pool = None
+        if threads > 1:
+            self.pool = ThreadPool(threads)
+
+    def mkdir(self, path):
+        if path not in self.dirs:
+            mkdir_p(path)
+            self.dirs.add(path)
+
+    def write(self, op, data):
+        self.mkdir(op.filedir)
+        if self.pool is None:
+            self.results.append(op.store_file(op.filedir, data, self.fsync))
+        else:
+            self.results.append(self.pool.apply_async(op.store_file, (op.filedir, data, self.fsync)))
+
+    def finish(self):
+        """wait for every write, returning the changed paths (or raising the first error)"""
+        if self.pool is not None:
+            for r in self.results:
+                r.wait()
+            self.results = list(map(lambda x: x.get(), self.results))
+
+        if self.fsync:
+            # make the renames durable too
+            for d in sorted(self.dirs):
+                fd = os.open(d, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+        ret = list(filter(lambda x: x is not None, self.results))
+        self.results = []
+        return ret
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etyp, evalue, etb):
+        if self.pool is not None and etyp is not None:
+            self.pool.terminate()
+            self.pool = None
+        self.close()
+        return False
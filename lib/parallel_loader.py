@@ -0,0 +1,273 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import multiprocessing
+import os
+import pickle
+import sys
+import traceback
+
+import kube_objs
+from obj_registry import obj_registry, get_ns
+from user_error import UserError, user_errors
+from output import RubiksOutputError
+
+# state handed to the forked workers, set just before the pool is created
+_STATE = None
+
+
+class WorkerFailed(Exception):
+    """a worker couldn't compile its sources (and has reported why), rc is the exit code to use"""
+    def __init__(self, rc):
+        Exception.__init__(self, 'worker process failed with exit code {}'.format(rc))
+        self.rc = rc
+
+
+class _KubePickler(pickle.Pickler):
+    def persistent_id(self, obj):
+        # kube_objs classes are compiled by the pluggable loader rather than imported from
+        # a module, so they can only be found again by name
+        if isinstance(obj, type):
+            if getattr(kube_objs, obj.__name__, None) is obj:
+                return ('class', obj.__name__)
+            return None
+
+        # namespaces are singletons looked up by name, so they are passed by reference and
+        # merged into the parent's copy instead of being duplicated per worker
+        if obj.__class__ is kube_objs.Namespace:
+            return ('Namespace', obj.name, sorted(obj.labels.items()), sorted(obj.annotations.items()))
+        return None
+
+
+class _KubeUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        if pid[0] == 'class':
+            return getattr(kube_objs, pid[1])
+        if pid[0] != 'Namespace':
+            raise pickle.UnpicklingError('unknown persistent id {}'.format(pid[0]))
+        ns = get_ns(None, pid[1])
+        for attr, items in (('labels', pid[2]), ('annotations', pid[3])):
+            current = getattr(ns, attr)
+            for k, v in items:
+                if k in current and current[k] != v:
+                    raise UserError(RubiksOutputError(
+                        "Namespace {} has different {} {} in sources compiled by different workers: "
+                        "{} and {} (rerun without -j)".format(pid[1], attr[:-1], k, current[k], v)))
+                current[k] = v
+        return ns
+
+
+def _dumps(payload):
+    f = io.BytesIO()
+    _KubePickler(f, 2).dump(payload)
+    return f.getvalue()
+
+
+def _loads(data, pythonpath):
+    # objects from pure-python modules need the repository pythonpath to be unpickled
+    savepath = sys.path
+    try:
+        sys.path = list(pythonpath) + sys.path
+        return _KubeUnpickler(io.BytesIO(data)).load()
+    finally:
+        sys.path = savepath
+
+
+def partition(paths, deps, jobs, cost=None, key=None):
+    """
+    split work items into at most jobs groups, keeping sources which import each other together
+
+    key maps a work item to its source in the deps graph (several items can share a source)
+    """
+    if cost is None:
+        cost = lambda x: 1
+    if key is None:
+        key = lambda x: x
+
+    by_key = {}
+    for p in paths:
+        by_key.setdefault(key(p), []).append(p)
+
+    parent = {}
+    def _find(p):
+        while parent[p] != p:
+            parent[p] = parent[parent[p]]
+            p = parent[p]
+        return p
+
+    for p in paths:
+        parent[p] = p
+
+    sizes = {}
+    for p in paths:
+        seen = set()
+        todo = [key(p)]
+        while len(todo) != 0:
+            n = todo.pop()
+            if n in seen:
+                continue
+            seen.add(n)
+            todo.extend(deps.get(n, ()))
+            if n != key(p):
+                for pp in by_key.get(n, ()):
+                    parent[_find(pp)] = _find(p)
+        sizes[p] = sum(map(cost, seen))
+
+    groups = {}
+    for p in paths:
+        groups.setdefault(_find(p), []).append(p)
+
+    group_list = sorted(groups.values(), key=lambda g: (-sum(map(lambda x: sizes[x], g)), g[0]))
+    bins = []
+    for g in group_list:
+        if len(bins) < jobs:
+            bins.append([0, []])
+        b = min(bins, key=lambda x: x[0])
+        b[0] += sum(map(lambda x: sizes[x], g))
+        b[1].extend(g)
+
+    order = dict(map(lambda x: (x[1], x[0]), enumerate(paths)))
+    return list(filter(lambda x: len(x) != 0,
+                       map(lambda b: sorted(b[1], key=lambda x: order[x]), bins)))
+
+
+def _load_partition(index):
+    collection, parts = _STATE
+    coll = collection.__class__(collection.repository, collection.outputs.content_check)
+    clusters = list(coll.repository.get_clusters())
+    seen = set()
+    outputs = []
+
+    # per-cluster sources only compile the clusters given to this worker
+    for i, p, ci in parts[index]:
+        if ci >= 0:
+            coll.cluster_restrict.setdefault(p.full_path, set()).add(clusters[ci])
+
+    try:
+        with user_errors():
+            for i, p, ci in parts[index]:
+                if p.full_path in coll.files:
+                    continue
+                coll.load_python(p)
+                owners = dict(map(lambda x: (id(x), x.path.src_rel_path), coll.files.values()))
+                for op in coll.outputs.get_outputs():
+                    if id(op) in seen:
+                        continue
+                    seen.add(id(op))
+                    owner = owners.get(obj_registry().get_owner(op.kobj), None)
+                    outputs.append((i, op.cluster, op.kobj, op.cached_obj, sorted(op.sources), owner))
+    except SystemExit as e:
+        return (index, None, e.code)
+    except Exception:
+        traceback.print_exc()
+        return (index, None, 1)
+
+    payload = {
+        'outputs': outputs,
+        'deps': coll.deps,
+        'inputs': coll.inputs,
+        'volatile': coll.volatile,
+        }
+
+    try:
+        return (index, _dumps(payload), 0)
+    except Exception as e:
+        print("ERROR: objects generated by {} can't be passed back from a worker process ({}), "
+              "rerun without -j".format(', '.join(sorted(set(map(lambda x: x[1].repo_rel_path, parts[index])))), e),
+              file=sys.stderr)
+        return (index, None, 1)
+
+
+def _get_pool(jobs):
+    if hasattr(multiprocessing, 'get_context'):
+        try:
+            return multiprocessing.get_context('fork').Pool(jobs)
+        except ValueError:
+            return None
+    if not hasattr(os, 'fork'):
+        return None
+    return multiprocessing.Pool(jobs)
+
+
+def load_parallel(collection, paths, jobs, deps=None):
+    """compile the paths in up to jobs worker processes and merge the results into collection"""
+    global _STATE
+
+    repository = collection.repository
+    srcs = os.path.join(repository.basepath, repository.sources)
+
+    def _cost(rel):
+        try:
+            return max(os.path.getsize(os.path.join(srcs, rel)), 1)
+        except OSError:
+            return 1
+
+    # per-cluster (.ekube) sources are split into one work item per cluster
+    clusters = list(repository.get_clusters())
+    items = {}
+    for i, p in enumerate(paths):
+        if collection.splits_per_cluster(p):
+            for ci in range(len(clusters)):
+                items[(p.src_rel_path, ci)] = (i, p, ci)
+        else:
+            items[(p.src_rel_path, -1)] = (i, p, -1)
+
+    groups = partition(sorted(items, key=lambda x: (items[x][0], x[1])), deps or {}, jobs,
+                       cost=lambda x: _cost(x[0]), key=lambda x: x[0])
+    parts = list(map(lambda g: list(map(lambda x: items[x], g)), groups))
+
+    if len(parts) <= 1:
+        return False
+
+    _STATE = (collection, parts)
+    try:
+        pool = _get_pool(min(jobs, len(parts)))
+        if pool is None:
+            print("WARN: parallel generation isn't available on this platform, compiling serially",
+                  file=sys.stderr)
+            return False
+        collection.debug(1, 'compiling {} sources ({} work items) in {} workers'.format(
+                         len(paths), len(items), len(parts)))
+        try:
+            results = pool.map(_load_partition, range(len(parts)), 1)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _STATE = None
+
+    failed = list(filter(lambda x: x[1] is None, results))
+    if len(failed) != 0:
+        raise WorkerFailed(failed[0][2] or 1)
+
+    pythonpath = getattr(repository, 'pythonpath', ())
+    outputs = []
+    for index, data, _ in sorted(results, key=lambda x: x[0]):
+        payload = _loads(data, pythonpath)
+        outputs.extend(map(lambda x: (x[0], index) + tuple(x[1:]), payload['outputs']))
+        for attr in ('deps', 'inputs'):
+            merged = getattr(collection, attr)
+            for k, v in payload[attr].items():
+                merged.setdefault(k, set()).update(v)
+        collection.volatile.update(payload['volatile'])
+
+    collection.loaded.extend(paths)
+
+    # merge in the order a serial run would have produced the objects
+    order = dict(map(lambda x: (x[1], x[0]), enumerate(clusters)))
+    outputs.sort(key=lambda x: (x[0], order.get(x[2], -1)))
+    for _, index, cluster, kobj, cached_obj, sources, owner in outputs:
+        try:
+            collection.outputs.merge_output(kobj, cluster, cached_obj, sources, origin=index, owner=owner)
+        except UserError as e:
+            e.f_file = kobj._caller_file
+            e.f_line = kobj._caller_line
+            e.f_fn = kobj._caller_fn
+            raise e
+
+    return True
@@ -17,19 +17,30 @@ class Repository(object):
     """object representing the repository in which the compiler is run"""
     def __init__(self, cwd=None):
         self.cwd = cwd
+        self._status = None
         self.find_worktree()
-        self.populate_status()
         self.sources = 'sources'
         self.outputs = 'generated'
 
+    @property
+    def status(self):
+        # only some commands look at the status, and it means a git status of the whole tree
+        if self._status is None:
+            self.populate_status()
+        return self._status
+
     def find_worktree(self):
+        self.basepath = self.find_worktree_fast()
+        if self.basepath is not None:
+            return
+
         p = subprocess.Popen(['git', 'worktree', 'list', '--porcelain'], cwd=self.cwd,
                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
         (out, err) = p.communicate()
 
         if p.returncode != 0:
-            raise RepositoryError("Git error: " + err.strip())
+            raise RepositoryError("Git error: " + err.strip().decode('utf8'))
 
         for l in out.splitlines():
             if l.startswith(b'worktree '):
@@ -38,8 +49,36 @@ class Repository(object):
 
         raise RepositoryError("No working tree found by git")
 
+    def find_worktree_fast(self):
+        """
+        the working tree, found by looking for a .git directory above the current directory, or
+        None to leave it to git: when the environment changes where git looks, or the .git is a
+        file (as in linked worktrees and submodules, where git gives the main working tree)
+        """
+        for e in ('GIT_DIR', 'GIT_WORK_TREE', 'GIT_CEILING_DIRECTORIES', 'GIT_DISCOVERY_ACROSS_FILESYSTEM'):
+            if e in os.environ:
+                return None
+
+        path = os.path.realpath(self.cwd if self.cwd is not None else os.getcwd())
+        if isinstance(path, bytes):
+            path = path.decode('utf8')
+
+        while True:
+            git = os.path.join(path, '.git')
+            if os.path.isdir(git):
+                if os.path.isfile(os.path.join(git, 'HEAD')):
+                    return path
+                return None
+            if os.path.exists(git):
+                return None
+
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
     def populate_status(self):
-        self.status = GitStatus(self.basepath)
+        self._status = GitStatus(self.basepath)
 
 
 class GitFile(object):
@@ -91,6 +91,7 @@ class RubiksRepository(repository.Repository, IniValue):
         self.clusters = {}
         self.is_openshift = False
         self.output_policybinding = False
+        self.bytecode_cache = False
         self.confidentiality_mode = None
         self.modules = []
 
@@ -111,6 +112,7 @@ class RubiksRepository(repository.Repository, IniValue):
 
             self.is_openshift = self._value(m_cp, 'global', 'is_openshift', 'bool', default=False)
             self.output_policybinding = self._value(m_cp, 'global', 'output_policybinding', 'bool', default=False)
+            self.bytecode_cache = self._value(m_cp, 'global', 'bytecode_cache', 'bool', default=False)
 
             for s in m_cp.sections():
                 if s.startswith('cluster_'):
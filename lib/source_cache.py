@@ -0,0 +1,208 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import os
+import sys
+
+from util import mkdir_p
+
+CACHE_DIR = '.rubiks-cache'
+
+
+def cache_dir(repository):
+    return os.path.join(repository.basepath, CACHE_DIR)
+
+
+def load_deps(repository):
+    """the import graph recorded by the last incremental run, without checking whether it's current"""
+    try:
+        with open(os.path.join(cache_dir(repository), SourceCache.filename)) as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+    if not isinstance(data, dict) or data.get('version') != SourceCache.version or \
+            not isinstance(data.get('deps'), dict):
+        return {}
+    return data['deps']
+
+
+class SourceCache(object):
+    """persistent record of the source dependency graph and the outputs of each run-once file"""
+
+    version = 1
+    filename = 'sources.json'
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.path = os.path.join(cache_dir(repository), self.filename)
+        self.srcsdir = os.path.join(repository.basepath, repository.sources)
+
+        self.env = self.get_env_key()
+        self.file_hashes = {}
+        self.hash_memo = {}
+        self.deps = {}
+        self.volatile = set()
+        self.outputs = {}
+        self.reused = set()
+
+        self.load()
+
+    def get_env_key(self):
+        # anything which changes the meaning of the sources without touching them invalidates
+        # the whole cache: the .rubiks file, rubiks itself, kube_objs modules and the pythonpath
+        h = hashlib.sha1()
+        h.update('{}:{}.{}'.format(self.version, *sys.version_info[0:2]).encode('utf8'))
+
+        try:
+            with open(os.path.join(self.repository.basepath, '.rubiks'), 'rb') as f:
+                h.update(f.read())
+        except (IOError, OSError):
+            pass
+
+        dirs = [os.path.split(os.path.realpath(__file__))[0]]
+        if hasattr(self.repository, 'get_modules'):
+            dirs.extend(map(lambda x: x.get_module_path(), self.repository.get_modules()))
+        if hasattr(self.repository, 'pythonpath'):
+            dirs.extend(self.repository.pythonpath)
+
+        for d in dirs:
+            for dpath, dnames, fnames in sorted(os.walk(d)):
+                dnames.sort()
+                for fn in sorted(fnames):
+                    if not fn.endswith('.py'):
+                        continue
+                    try:
+                        st = os.stat(os.path.join(dpath, fn))
+                    except OSError:
+                        continue
+                    h.update('{}:{}:{}\n'.format(os.path.join(dpath, fn), st.st_mtime, st.st_size).encode('utf8'))
+
+        return h.hexdigest()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+
+        if not isinstance(data, dict) or data.get('version') != self.version or data.get('env') != self.env:
+            return
+
+        self.file_hashes = data['files']
+        self.deps = data['deps']
+        self.volatile = set(data['volatile'])
+        self.outputs = data['outputs']
+
+    def hash_file(self, rel_path):
+        if rel_path in self.hash_memo:
+            return self.hash_memo[rel_path]
+
+        full_path = os.path.join(self.srcsdir, rel_path)
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            self.hash_memo[rel_path] = None
+            return None
+
+        old = self.file_hashes.get(rel_path, None)
+        if old is not None and old[0] == st.st_mtime and old[1] == st.st_size:
+            ret = old
+        else:
+            try:
+                with open(full_path, 'rb') as f:
+                    ret = [st.st_mtime, st.st_size, hashlib.sha1(f.read()).hexdigest()]
+            except (IOError, OSError):
+                ret = None
+
+        self.hash_memo[rel_path] = ret
+        return ret
+
+    def closure(self, rel_path, deps=None):
+        if deps is None:
+            deps = self.deps
+        ret = set()
+        todo = [rel_path]
+        while len(todo) != 0:
+            p = todo.pop()
+            if p in ret:
+                continue
+            ret.add(p)
+            todo.extend(deps.get(p, ()))
+        return ret
+
+    def is_fresh(self, rel_path):
+        if rel_path not in self.outputs:
+            return False
+
+        for p in self.closure(rel_path):
+            if p in self.volatile:
+                return False
+            old = self.file_hashes.get(p, None)
+            new = self.hash_file(p)
+            if old is None or new is None or old[2] != new[2]:
+                return False
+
+        base = os.path.join(self.repository.basepath, self.repository.outputs)
+        for o in self.outputs[rel_path]:
+            if not os.path.exists(os.path.join(base, o[0])):
+                return False
+
+        return True
+
+    def reuse(self, rel_path):
+        self.reused.add(rel_path)
+        return self.outputs[rel_path]
+
+    def unreuse(self, rel_path):
+        self.reused.discard(rel_path)
+        return self.outputs[rel_path]
+
+    def save(self, deps, volatile, outputs):
+        n_deps = {}
+        n_volatile = set()
+        n_outputs = {}
+
+        for p in self.reused:
+            for pp in self.closure(p):
+                n_deps[pp] = self.deps.get(pp, [])
+                if pp in self.volatile:
+                    n_volatile.add(pp)
+            n_outputs[p] = self.outputs[p]
+
+        for p in deps:
+            n_deps[p] = sorted(deps[p])
+        n_volatile.update(volatile)
+        for p in outputs:
+            n_outputs[p] = sorted(outputs[p])
+
+        files = {}
+        for p in n_deps:
+            h = self.hash_file(p)
+            if h is not None:
+                files[p] = h
+            for pp in n_deps[p]:
+                h = self.hash_file(pp)
+                if h is not None:
+                    files[pp] = h
+
+        data = {
+            'version': self.version,
+            'env': self.env,
+            'files': files,
+            'deps': n_deps,
+            'volatile': sorted(n_volatile),
+            'outputs': n_outputs,
+            }
+
+        mkdir_p(os.path.split(self.path)[0])
+        with open(self.path + '.tmp', 'w') as f:
+            f.write(json.dumps(data, indent=1, sort_keys=True))
+        os.rename(self.path + '.tmp', self.path)
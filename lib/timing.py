@@ -0,0 +1,167 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# wall and cpu time spent in each phase of a run (rubiks generate --profile). Phases nest, so the
+# totals of eg. compile include the render of the objects output while compiling. Per-source compile
+# times are "self" times, without the other sources imported while compiling them.
+
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    _cpu = time.process_time
+except AttributeError:
+    _cpu = time.clock
+
+_enabled = False
+_trace = None
+_start = None
+_lock = threading.Lock()
+_local = threading.local()
+_phases = {}
+_keys = {}
+_counters = {}
+
+
+class _Nothing(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etyp, evalue, etb):
+        return False
+
+_nothing = _Nothing()
+
+
+class _Phase(object):
+    __slots__ = ('name', 'key', 'wall', 'cpu', 'child_wall', 'child_cpu')
+
+    def __init__(self, name, key):
+        self.name = name
+        self.key = key
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.child_wall = 0.0
+        self.child_cpu = 0.0
+        self.cpu = _cpu()
+        self.wall = time.time()
+        return self
+
+    def __exit__(self, etyp, evalue, etb):
+        end = time.time()
+        wall = end - self.wall
+        cpu = _cpu() - self.cpu
+
+        stack = _local.stack
+        stack.pop()
+        nested = False
+        for p in reversed(stack):
+            if p.name == self.name:
+                p.child_wall += wall
+                p.child_cpu += cpu
+                nested = True
+                break
+
+        with _lock:
+            if nested:
+                # already counted in the enclosing one
+                _add(_phases, self.name, 0.0, 0.0)
+            else:
+                _add(_phases, self.name, wall, cpu)
+            if self.key is not None:
+                _add(_keys, (self.name, self.key), wall - self.child_wall, cpu - self.child_cpu)
+            if _trace is not None:
+                ev = {'name': self.name if self.key is None else self.key, 'cat': self.name, 'ph': 'X',
+                      'ts': int((self.wall - _start) * 1000000), 'dur': int(wall * 1000000),
+                      'pid': os.getpid(), 'tid': threading.current_thread().ident}
+                _trace.append(ev)
+        return False
+
+
+def _add(d, k, wall, cpu):
+    if k not in d:
+        d[k] = [0, 0.0, 0.0]
+    d[k][0] += 1
+    d[k][1] += wall
+    d[k][2] += cpu
+
+
+def enable(trace=False):
+    global _enabled, _trace, _start
+    _enabled = True
+    _start = time.time()
+    _trace = [] if trace else None
+    _phases.clear()
+    _keys.clear()
+    _counters.clear()
+
+
+def disable():
+    """stop timing, forgetting what was recorded"""
+    global _enabled, _trace, _start
+    _enabled = False
+    _start = None
+    _trace = None
+    _phases.clear()
+    _keys.clear()
+    _counters.clear()
+
+
+def is_enabled():
+    return _enabled
+
+
+def phase(name, key=None):
+    """context manager timing a phase of the run (and the key, eg. a source file, within it)"""
+    if not _enabled:
+        return _nothing
+    return _Phase(name, key)
+
+
+def count(name, n=1):
+    """add to a counter (eg. of cache hits) reported with the phases"""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def report(top=10, f=None):
+    if f is None:
+        f = sys.stderr
+
+    print('{:<20} {:>8} {:>10} {:>10}'.format('phase', 'count', 'wall', 'cpu'), file=f)
+    for name in sorted(_phases, key=lambda x: -_phases[x][1]):
+        count, wall, cpu = _phases[name]
+        print('{:<20} {:>8} {:>10.3f} {:>10.3f}'.format(name, count, wall, cpu), file=f)
+
+    if len(_counters) != 0:
+        print('', file=f)
+        for name in sorted(_counters):
+            print('{:<29} {:>8}'.format(name, _counters[name]), file=f)
+
+    for name in sorted(set(map(lambda x: x[0], _keys))):
+        keys = list(filter(lambda x: x[0] == name, _keys))
+        keys.sort(key=lambda x: (-_keys[x][1], x[1]))
+        print('', file=f)
+        print('slowest {} ({} of {}, excluding nested ones)'.format(name, min(top, len(keys)), len(keys)), file=f)
+        for k in keys[:top]:
+            count, wall, cpu = _keys[k]
+            print('  {:>10.3f} {:>10.3f}  {}'.format(wall, cpu, k[1]), file=f)
+
+
+def write_trace(path):
+    """write out the phases as a chrome://tracing (Trace Event Format) JSON file"""
+    with open(path, 'w') as f:
+        f.write(json.dumps({'traceEvents': _trace or [], 'displayTimeUnit': 'ms'}))
@@ -0,0 +1,165 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# times rubiks commands (generate, order, yaml_diff, gen_py) against a synthetic repository from
+# synth_repo.py, optionally saving the results as JSON and comparing them with an earlier run
+#
+# usage: python test/bench/bench_commands.py [--output results.json] [--compare old.json] [repo options]
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
+
+import python_path
+import kube_yaml
+import synth_repo
+
+RUBIKS = os.path.join(python_path.repobase, 'rubiks')
+
+
+def rubiks(repo, *args, **kwargs):
+    with open(os.devnull, 'w') as null:
+        rc = subprocess.call([sys.executable, RUBIKS] + list(args), cwd=repo, stdout=null, stderr=null)
+    if rc not in kwargs.get('ok', (0,)):
+        raise RuntimeError('rubiks {} failed ({})'.format(' '.join(args), rc))
+
+
+def clean(repo):
+    for d in ('generated', '.rubiks-cache'):
+        shutil.rmtree(os.path.join(repo, d), ignore_errors=True)
+
+
+def make_bundles(repo, clusters):
+    """two YAML files of all the outputs in one cluster (or clusterless), differing in a few places"""
+    base = os.path.join(repo, 'generated')
+    if clusters != 0:
+        base = os.path.join(base, 'cluster0')
+
+    bundle = {}
+    dc_file = None
+    for dpath, dnames, fnames in sorted(os.walk(base)):
+        for fn in sorted(fnames):
+            if not fn.endswith('.yaml'):
+                continue
+            with io.open(os.path.join(dpath, fn), encoding='utf8') as f:
+                bundle[os.path.relpath(os.path.join(dpath, fn), base)] = kube_yaml.yaml_load(f.read())
+            if dc_file is None and fn.startswith('deploymentconfig-'):
+                dc_file = os.path.join(dpath, fn)
+
+    with io.open(os.path.join(repo, 'bundle-a.yaml'), 'w', encoding='utf8') as f:
+        f.write(kube_yaml.yaml_safe_dump(bundle))
+
+    for i, k in enumerate(sorted(bundle)):
+        if i % 2 == 0 and bundle[k].get('kind') == 'DeploymentConfig':
+            bundle[k]['spec']['replicas'] += 1
+            bundle[k]['spec']['template']['spec']['containers'][0]['env'].pop()
+    with io.open(os.path.join(repo, 'bundle-b.yaml'), 'w', encoding='utf8') as f:
+        f.write(kube_yaml.yaml_safe_dump(bundle))
+
+    return dc_file
+
+
+def timed(repeat, fn, setup=None):
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.time()
+        fn()
+        runs.append(time.time() - start)
+    return {'min': min(runs), 'runs': runs}
+
+
+def run_benchmarks(repo, clusters, repeat, jobs):
+    results = {}
+    results['startup'] = timed(repeat, lambda: rubiks(repo, 'help'))
+    results['generate'] = timed(repeat, lambda: rubiks(repo, 'generate'), setup=lambda: clean(repo))
+    results['generate (unchanged)'] = timed(repeat, lambda: rubiks(repo, 'generate'))
+    results['generate -i (unchanged)'] = timed(repeat, lambda: rubiks(repo, 'generate', '-i'),
+                                               setup=lambda: rubiks(repo, 'generate', '-i'))
+    if jobs > 1:
+        results['generate -j{}'.format(jobs)] = timed(repeat, lambda: rubiks(repo, 'generate', '-j', str(jobs)),
+                                                      setup=lambda: clean(repo))
+
+    dc_file = make_bundles(repo, clusters)
+    results['order'] = timed(repeat, lambda: rubiks(repo, 'order', 'generated'))
+    results['yaml_diff'] = timed(repeat, lambda: rubiks(repo, 'yaml_diff', 'bundle-a.yaml', 'bundle-b.yaml',
+                                                        ok=(0, 1)))
+    results['gen_py'] = timed(repeat, lambda: rubiks(repo, 'gen_py', dc_file))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=python_path.repobase).decode('utf8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    print('')
+    print('{:<28} {:>10} {:>10} {:>8}'.format('compared with', 'old', 'new', 'ratio'))
+    for k in sorted(new['results']):
+        if k not in old['results']:
+            continue
+        o = old['results'][k]['min']
+        n = new['results'][k]['min']
+        print('{:<28} {:>10.3f} {:>10.3f} {:>7.2f}x'.format(k, o, n, o / n if n != 0 else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='time rubiks commands on a synthetic repository')
+    synth_repo.add_args(parser)
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each benchmark (the fastest is reported)')
+    parser.add_argument('--jobs', type=int, default=4, help='workers for the generate -j benchmark (1 to skip)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare with the results in this JSON file')
+    parser.add_argument('--keep', action='store_true', help="don't remove the synthetic repository")
+    args = parser.parse_args()
+
+    params = synth_repo.repo_args(args)
+    tmp = tempfile.mkdtemp()
+    repo = os.path.join(tmp, 'repo')
+    try:
+        synth_repo.make_repo(repo, **params)
+        results = run_benchmarks(repo, args.clusters, args.repeat, args.jobs)
+    finally:
+        if args.keep:
+            print('repository kept in {}'.format(repo))
+        else:
+            shutil.rmtree(tmp)
+
+    data = {
+        'python': platform.python_version(),
+        'revision': git_revision(),
+        'params': params,
+        'results': results,
+        }
+
+    for k in sorted(results):
+        print('{:<28} {:>10.3f}'.format(k, results[k]['min']))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(json.dumps(data, indent=1, sort_keys=True))
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(json.load(f), data)
+
+
+if __name__ == '__main__':
+    main()
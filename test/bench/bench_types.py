@@ -0,0 +1,71 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# compares KubeType.check() (walking the type tree and building paths) with the compiled
+# KubeType.checker() on the values test/test/test_types.py accepts
+#
+# usage: python test/bench/bench_types.py [iterations]
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
+
+import python_path
+from kube_types import *
+
+CASES = (
+    (Boolean(), (True, False)),
+    (Integer(), (549, 1234567891234567)),
+    (Number(), (549, 1234567891234567, 12.34567891234567)),
+    (String(), ('', 'foo')),
+    (Enum('a', 'b'), ('a', 'b')),
+    (List(String), ([], ['abc'], ['abc', 'xyz'])),
+    (Map(Integer, String), ({}, {1: 'abc', 3: 'def'})),
+    (Nullable(String), (None, '', 'foo')),
+    (NonEmpty(String), ('foo',)),
+    (Positive(Integer), (0, 5)),
+    (Positive(Number), (0, 0., 5, 5.5)),
+    (NonZero(Integer), (-1, 1)),
+    (Identifier(), ('my-foo-bar', 'my-foo-bar0', 'my-foo-bar0.1')),
+    (ARN(), ('arn:aws:iam:12345:....', 'arn:aws-beijing:iam:12345:....')),
+    (Path(), ('', '/a/b/c', '/a')),
+    (NonEmpty(List(Positive(NonZero(Integer)))), ([1, 2, 3, 4, 5, 6, 7, 8],)),
+    (NonEmpty(Map(String, List(Identifier))), ({'a': ['b', 'c'], 'd': ['e']},)),
+    (OneOf(Positive(NonZero(Integer)), Identifier), (8080, 'http')),
+    )
+
+
+def run_check():
+    for t, values in CASES:
+        for v in values:
+            t.check(v, 'self.attr')
+
+
+def run_checker():
+    for t, values in CASES:
+        check = t.checker()
+        for v in values:
+            if not check(v):
+                t.check(v, 'self.attr')
+
+
+def main():
+    number = 2000
+    if len(sys.argv) > 1:
+        number = int(sys.argv[1])
+
+    run_checker()
+    tree = min(timeit.repeat(run_check, number=number, repeat=3))
+    compiled = min(timeit.repeat(run_checker, number=number, repeat=3))
+    print('KubeType.check():   {:.3f}s'.format(tree))
+    print('KubeType.checker(): {:.3f}s ({:.1f}x)'.format(compiled, tree / compiled))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# writes out a synthetic rubiks repository for benchmarking: a namespace source file per namespace,
+# each with a number of DeploymentConfigs (with a container, env, ports, probes, a config volume,
+# a ConfigMap and a Service), importing some of a set of shared .kube libraries
+#
+# usage: python test/bench/synth_repo.py [options] <directory>
+
+import argparse
+import io
+import os
+import subprocess
+
+LIBRARY = """
+def labels_for(name, ns):
+    return {{'app': name, 'namespace': ns, 'lib': 'common{lib}'}}
+
+
+def env_for(name, size, cluster):
+    ret = {{'APP_NAME': name, 'APP_LIB': 'common{lib}'}}
+    for i in range(size):
+        ret['SETTING_{{}}'.format(i)] = '{{}}-value-{{}}'.format(name, i)
+    if cluster is not None:
+        ret['CLUSTER'] = cluster
+    return ret
+
+
+def app_{lib}(name, ns, image, cluster=None, env_size=10, replicas=2):
+    labels = labels_for(name, ns)
+
+    cm = ConfigMap(name + '-config', files={{
+        'app.properties': '\\n'.join('key{{}}=value{{}}'.format(i, i) for i in range(env_size)),
+        }})
+
+    dc = DeploymentConfig(name, replicas=replicas, selector=labels)
+    dc.labels.update(labels)
+    dc.pod_template.labels.update(labels)
+    dc.pod_template.containers.append(ContainerSpec(name, image=image, command=['/bin/app', '--port', '8080']))
+    ctr = dc.pod_template.containers[-1]
+    ctr.env = env_for(name, env_size, cluster)
+    ctr.new_port(containerPort=8080)
+    ctr.new_livenessProbe(ContainerProbeTCPPortSpec, port=8080, timeoutSeconds=5, initialDelaySeconds=10)
+    ctr.volumeMounts = [ContainerVolumeMountSpec(name='config', path='/etc/app')]
+    dc.pod_template.volumes = [PodVolumeConfigMapSpec(name='config', map_name=cm.name)]
+
+    svc = ClusterIPService(name, selector=labels)
+    svc.ports.append(ServicePort(name='http', protocol='TCP', port=80, targetPort=8080))
+
+    return dc
+"""
+
+NAMESPACE = """
+{imports}
+
+with namespace('{ns}'):
+    for i in range({deployments}):
+        image = 'registry.example.com/{ns}/app-{{}}:1.0'.format(i)
+        {lib_fn}('app-{{}}'.format(i), '{ns}', image, cluster={cluster}, env_size={env_size})
+"""
+
+
+def write(path, content):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with io.open(path, 'w', encoding='utf8') as f:
+        f.write(content.lstrip())
+
+
+def make_repo(path, namespaces=20, deployments=10, clusters=3, fan_in=3, libraries=5, env_size=10):
+    """write the synthetic repository to path (which must not exist), returning the source files"""
+    os.makedirs(path)
+    subprocess.check_call(['git', 'init', '-q', path])
+
+    rubiks = ['[layout]', 'sources = sources', 'outputs = generated', '']
+    for c in range(clusters):
+        rubiks.extend(['[cluster_cluster{}]'.format(c), 'prod_state = {}'.format('production' if c == 0 else 'staging'),
+                       ''])
+    write(os.path.join(path, '.rubiks'), '\n'.join(rubiks))
+
+    for lib in range(libraries):
+        write(os.path.join(path, 'sources', 'lib', 'common{}.kube'.format(lib)), LIBRARY.format(lib=lib))
+
+    ext = 'ekube' if clusters != 0 else 'gkube'
+    cluster = 'current_cluster_name' if clusters != 0 else 'None'
+    files = []
+    for n in range(namespaces):
+        libs = list(map(lambda x: (n + x) % libraries, range(min(fan_in, libraries))))
+        imports = '\n'.join(map(lambda x: "import_python('lib/common{0}.kube', 'app_{0}')".format(x), libs))
+        fn = os.path.join(path, 'sources', 'ns{}.{}'.format(n, ext))
+        write(fn, NAMESPACE.format(imports=imports, ns='ns{}'.format(n), deployments=deployments,
+                                   lib_fn='app_{}'.format(libs[0]), cluster=cluster, env_size=env_size))
+        files.append(fn)
+    return files
+
+
+def add_args(parser):
+    parser.add_argument('--namespaces', type=int, default=20, help='number of namespaces (and source files)')
+    parser.add_argument('--deployments', type=int, default=10, help='DeploymentConfigs per namespace')
+    parser.add_argument('--clusters', type=int, default=3, help='number of clusters (0 for clusterless)')
+    parser.add_argument('--fan-in', type=int, default=3, help='libraries imported by each namespace file')
+    parser.add_argument('--libraries', type=int, default=5, help='number of shared .kube libraries')
+    parser.add_argument('--env-size', type=int, default=10, help='environment variables per container')
+
+
+def repo_args(args):
+    return {
+        'namespaces': args.namespaces,
+        'deployments': args.deployments,
+        'clusters': args.clusters,
+        'fan_in': args.fan_in,
+        'libraries': args.libraries,
+        'env_size': args.env_size,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='write a synthetic rubiks repository')
+    add_args(parser)
+    parser.add_argument('directory', help='where to write the repository (must not exist)')
+    args = parser.parse_args()
+    make_repo(args.directory, **repo_args(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import python_path
+import code_cache
+
+
+class TestCodeCache(unittest.TestCase):
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        code_cache.set_cache_dir(os.path.join(self.base, 'bytecode'))
+
+    def tearDown(self):
+        code_cache.set_cache_dir(None)
+        shutil.rmtree(self.base)
+
+    def run_code(self, src, path='test.kube'):
+        ns = {}
+        exec(code_cache.compile_source(src, path), ns, ns)
+        return ns
+
+    def test_hit(self):
+        before = code_cache.get_stats()
+        self.assertEqual(self.run_code('x = 1 / 2\ny = "a"')['x'], 0.5)
+        ns = self.run_code('x = 1 / 2\ny = "a"')
+        after = code_cache.get_stats()
+        self.assertEqual(ns['x'], 0.5)
+        self.assertEqual(ns['y'], u'a')
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+
+    def test_changed_source(self):
+        self.assertEqual(self.run_code('x = 1')['x'], 1)
+        self.assertEqual(self.run_code('x = 2')['x'], 2)
+        self.assertEqual(self.run_code('x = 3', path='other.kube')['x'], 3)
+        self.assertEqual(self.run_code('x = 2')['x'], 2)
+
+    def test_corrupt_cache(self):
+        self.run_code('x = 1')
+        d = os.path.join(self.base, 'bytecode')
+        for fn in os.listdir(d):
+            with open(os.path.join(d, fn), 'wb') as f:
+                f.write(b'garbage')
+        self.assertEqual(self.run_code('x = 1')['x'], 1)
+
+    def test_syntax_error(self):
+        self.assertRaises(SyntaxError, code_cache.compile_source, 'x = ', 'test.kube')
+
+
+if __name__ == '__main__':
+    unittest.main()
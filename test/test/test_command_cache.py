@@ -0,0 +1,98 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import python_path
+import command_cache
+import kube_vartypes
+
+
+class TestCommandCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = os.path.join(self.tmp, 'commands')
+        self.input = os.path.join(self.tmp, 'input')
+        self.write_input('one')
+        command_cache.set_cache_dir(self.cache)
+        kube_vartypes.clear_command_results()
+
+    def tearDown(self):
+        command_cache.set_cache_dir(None)
+        kube_vartypes.clear_command_results()
+        shutil.rmtree(self.tmp)
+
+    def write_input(self, text):
+        with open(self.input, 'w') as f:
+            f.write(text)
+        command_cache._hashes.clear()
+
+    def run_cmd(self, **kwargs):
+        # start a new run each time, so only the persistent cache is used
+        kube_vartypes.clear_command_results()
+        script = "import sys, time; sys.stdout.write(open(sys.argv[1]).read() + str(time.time()))"
+        kwargs.setdefault('inputs', [self.input])
+        return str(kube_vartypes.Command([sys.executable, '-c', script, self.input], **kwargs))
+
+    def test_inputs(self):
+        out = self.run_cmd(cache=True)
+        self.assertEqual(self.run_cmd(cache=True), out)
+        self.assertNotEqual(self.run_cmd(), out)
+
+        self.write_input('two')
+        out2 = self.run_cmd(cache=True)
+        self.assertTrue(out2.startswith('two'))
+        self.assertEqual(self.run_cmd(cache=True), out2)
+        self.assertEqual(len(command_cache.entries()), 1)
+
+    def test_expiry(self):
+        out = self.run_cmd(cache=3600)
+        self.assertEqual(self.run_cmd(cache=3600), out)
+
+        name, entry = command_cache.entries()[0]
+        self.assertTrue(command_cache.is_current(entry))
+        self.assertFalse(command_cache.is_current(entry, now=entry['created'] + 3601))
+
+        entry['expires'] = entry['created']
+        with open(os.path.join(self.cache, name + '.json'), 'w') as f:
+            f.write(json.dumps(entry))
+        self.assertNotEqual(self.run_cmd(cache=3600), out)
+
+        command_cache.purge([name])
+        self.assertEqual(command_cache.entries(), [])
+
+    def test_key(self):
+        os.environ['RUBIKS_TEST_CACHE'] = 'a'
+        try:
+            out = self.run_cmd(cache=True, cache_env=['RUBIKS_TEST_CACHE'])
+            self.assertEqual(self.run_cmd(cache=True, cache_env=['RUBIKS_TEST_CACHE']), out)
+            self.assertNotEqual(self.run_cmd(cache=True, env={'A': 'b'}), out)
+            os.environ['RUBIKS_TEST_CACHE'] = 'b'
+            self.assertNotEqual(self.run_cmd(cache=True, cache_env=['RUBIKS_TEST_CACHE']), out)
+        finally:
+            del os.environ['RUBIKS_TEST_CACHE']
+
+        # the environment values aren't stored
+        for name, entry in command_cache.entries():
+            self.assertTrue(entry['env'] in ([], ['A'], ['RUBIKS_TEST_CACHE']))
+
+    def test_refresh(self):
+        out = self.run_cmd(cache=True)
+        command_cache.set_cache_dir(self.cache, refresh=True)
+        out2 = self.run_cmd(cache=True)
+        self.assertNotEqual(out2, out)
+        command_cache.set_cache_dir(self.cache)
+        self.assertEqual(self.run_cmd(cache=True), out2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import python_path
+import kube_vartypes
+from user_error import UserError
+
+
+class TestCommand(unittest.TestCase):
+    def setUp(self):
+        kube_vartypes.clear_command_results()
+        self.tmp = tempfile.mkdtemp()
+        self.count = os.path.join(self.tmp, 'count')
+
+    def tearDown(self):
+        kube_vartypes.clear_command_results()
+        shutil.rmtree(self.tmp)
+
+    def command(self, text, **kwargs):
+        # appends a line to the count file every time it's run
+        script = "import sys; open(sys.argv[1], 'a').write('x\\n'); sys.stdout.write(sys.argv[2])"
+        return kube_vartypes.Command([sys.executable, '-c', script, self.count, text], **kwargs)
+
+    def runs(self):
+        if not os.path.exists(self.count):
+            return 0
+        with open(self.count) as f:
+            return len(f.readlines())
+
+    def test_run_once(self):
+        c1 = self.command('out \n', rstrip=True)
+        c2 = self.command('out \n', eol=True)
+        c3 = self.command('other')
+        self.assertEqual(str(c1), 'out')
+        self.assertEqual(str(c2), 'out \n')
+        self.assertEqual(str(c1.clone()), 'out')
+        self.assertEqual(self.runs(), 1)
+        self.assertEqual(str(c3), 'other')
+        self.assertEqual(self.runs(), 2)
+
+    def test_run_commands(self):
+        cmds = list(map(lambda x: self.command('out{}'.format(x % 3)), range(6)))
+        cmds.append(self.command('out0', env={'A': 1}))
+        self.assertEqual(kube_vartypes.run_commands(cmds, 4), 4)
+        self.assertEqual(self.runs(), 4)
+        self.assertEqual(list(map(str, cmds)), ['out0', 'out1', 'out2', 'out0', 'out1', 'out2', 'out0'])
+        self.assertEqual(self.runs(), 4)
+        self.assertEqual(kube_vartypes.run_commands(cmds, 4), 0)
+
+    def test_find_commands(self):
+        used = [self.command('a'), self.command('b'), self.command('c')]
+        unused = self.command('d')
+        rendered = {'x': [used[0], 'prefix ' + used[1]], 'y': kube_vartypes.JSON({'z': (used[2],)})}
+
+        found = kube_vartypes.find_commands(rendered)
+        self.assertEqual(sorted(map(lambda x: x.key(), found)), list(map(lambda x: x.key(), used)))
+        kube_vartypes.run_commands(found)
+        self.assertEqual(self.runs(), 3)
+
+        # commands which aren't output are only run if their value is used
+        self.assertEqual(str(unused), 'd')
+        self.assertEqual(self.runs(), 4)
+
+    def test_errors(self):
+        failing = kube_vartypes.Command([sys.executable, '-c', 'import sys; sys.exit(3)'], good_rc=(0,))
+        missing = kube_vartypes.Command([os.path.join(self.tmp, 'missing')])
+        kube_vartypes.run_commands([failing, missing], 2)
+        self.assertRaises(UserError, str, failing)
+        self.assertRaises(UserError, str, missing)
+        self.assertEqual(failing.validation_value(), 'command_output')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import python_path
+import kube_loader
+import load_python
+import obj_registry
+import rubiks_repository
+from user_error import UserError
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.repo = os.path.realpath(tempfile.mkdtemp())
+        os.mkdir(os.path.join(self.repo, 'sources'))
+        with open(os.devnull, 'w') as null:
+            subprocess.check_call(['git', 'init', '-q', self.repo], stdout=null, stderr=null)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo)
+
+    def write_src(self, name, content):
+        with open(os.path.join(self.repo, 'sources', name), 'w') as f:
+            f.write(content)
+
+    def read_output(self, name):
+        with open(os.path.join(self.repo, 'generated', name)) as f:
+            return f.read()
+
+    def generate(self):
+        # every run starts from a fresh registry, as separate rubiks invocations would
+        registry = obj_registry.set_obj_registry(obj_registry.ObjectRegistry())
+        try:
+            repo = rubiks_repository.RubiksRepository(cwd=self.repo)
+            kube_loader.load(*[x.get_module_path() for x in repo.get_modules()])
+            obj_registry.init(repo.is_openshift)
+            collection = load_python.PythonFileCollection(repo, incremental=True)
+            collection.load_all_python(repo.sources)
+            collection.gen_output()
+        finally:
+            obj_registry.set_obj_registry(registry)
+
+    def test_shared_namespace(self):
+        self.write_src('a.gkube', "with namespace('shared'):\n"
+                                  "    get_namespace().labels['team'] = 'a'\n"
+                                  "    ConfigMap('a', files={'x': 'y'})\n")
+        self.write_src('b.gkube', "with namespace('shared'):\n"
+                                  "    ConfigMap('b', files={'x': 'y'})\n")
+        self.generate()
+        self.assertTrue('team: a' in self.read_output('shared/namespace-shared.yaml'))
+
+        self.write_src('b.gkube', "with namespace('shared'):\n"
+                                  "    ConfigMap('b', files={'x': 'z'})\n")
+        self.generate()
+        self.assertTrue('team: a' in self.read_output('shared/namespace-shared.yaml'))
+        self.assertTrue('x: z' in self.read_output('shared/configmap-b.yaml'))
+
+    def test_duplicate_in_unchanged_source(self):
+        self.write_src('a.gkube', "ConfigMap('a', files={'x': 'y'})\n")
+        self.write_src('b.gkube', "ConfigMap('b', files={'x': 'y'})\n")
+        self.generate()
+
+        self.write_src('b.gkube', "ConfigMap('a', files={'x': 'z'})\n")
+        self.assertRaises(UserError, self.generate)
+
+
+if __name__ == '__main__':
+    unittest.main()
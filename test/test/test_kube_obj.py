@@ -0,0 +1,274 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import gc
+import traceback
+import unittest
+
+import python_path
+from kube_obj import KubeSubObj
+from kube_types import Integer, List, Map, Nullable, String
+import obj_registry
+
+
+def make_classes(test):
+    # the classes are made for each test and dropped afterwards, as kube_loader.load() (in other
+    # tests) finds every KubeSubObj subclass still alive
+    class Base(KubeSubObj):
+        _defaults = {
+            'items': [],
+            'opts': {'a': 1},
+            'name': 'base',
+            }
+        _types = {
+            'items': List(String),
+            'opts': Map(String, Integer),
+            }
+        _map = {'item': 'items'}
+
+        validations = 0
+
+        def do_validate(self):
+            Base.validations += 1
+            return True
+
+        def render(self):
+            return self.renderer(zlen_ok=('items',))
+
+    class Derived(Base):
+        _defaults = {
+            'name': 'derived',
+            'extra': None,
+            }
+
+    class Counted(KubeSubObj):
+        _defaults = {
+            'child': None,
+            'values': [],
+            }
+        _types = {
+            'child': Nullable(Base),
+            'values': List(String),
+            }
+
+        renders = 0
+
+        def render(self):
+            Counted.renders += 1
+            return self.renderer()
+
+    class Regenerated(Counted):
+        _always_regenerate = True
+
+    test.Base = Base
+    test.Derived = Derived
+    test.Counted = Counted
+    test.Regenerated = Regenerated
+
+
+class ClassesTestCase(unittest.TestCase):
+    def setUp(self):
+        # a registry of our own, which (with its objects and classes) is dropped afterwards
+        self.registry = obj_registry.set_obj_registry(obj_registry.ObjectRegistry())
+        make_classes(self)
+
+    def tearDown(self):
+        del self.Base, self.Derived, self.Counted, self.Regenerated
+        obj_registry.set_obj_registry(self.registry)
+        gc.collect()
+        self.assertEqual(list(filter(lambda x: x.__module__ == __name__, KubeSubObj.get_subclasses(False))), [])
+
+
+class TestDefaults(ClassesTestCase):
+    def test_instances_independent(self):
+        a = self.Base()
+        b = self.Base()
+        a.items.append('x')
+        a.opts['b'] = 2
+        self.assertEqual(b.items, [])
+        self.assertEqual(b.opts, {'a': 1})
+        self.assertEqual(self.Base()._data['items'], [])
+        self.assertEqual(self.Base._defaults['items'], [])
+
+    def test_find_defaults_is_a_copy(self):
+        d = self.Base._find_defaults('_defaults')
+        d['opts']['a'] = 5
+        d['name'] = 'changed'
+        self.assertEqual(self.Base._find_defaults('_defaults')['opts'], {'a': 1})
+        self.assertEqual(self.Base._find_defaults('_defaults')['name'], 'base')
+
+    def test_subclass(self):
+        self.Base._find_defaults('_defaults')
+        d = self.Derived._find_defaults('_defaults')
+        self.assertEqual(d['name'], 'derived')
+        self.assertEqual(sorted(d.keys()), ['extra', 'items', 'name', 'opts'])
+        self.assertEqual(self.Base._find_defaults('_defaults')['name'], 'base')
+        self.assertEqual(self.Derived._get_defaults('_map'), {'item': 'items'})
+
+
+class TestCallerLocation(ClassesTestCase):
+    def test_caller_recorded(self):
+        obj, expected = self.Base(), traceback.extract_stack(limit=1)[0]
+        self.assertEqual((obj._caller_file, obj._caller_line, obj._caller_fn), tuple(expected[0:3]))
+
+        obj2, expected = obj.clone(), traceback.extract_stack(limit=1)[0]
+        self.assertEqual((obj2._caller_file, obj2._caller_line, obj2._caller_fn), tuple(expected[0:3]))
+
+
+class TestRenderCache(ClassesTestCase):
+    def setUp(self):
+        ClassesTestCase.setUp(self)
+        self.Counted.renders = 0
+
+    def test_cached(self):
+        obj = self.Counted(child=self.Base(items=['x']), values=['a'])
+        first = obj.do_render()
+        first['values'].append('b')
+        self.assertEqual(obj.do_render(), {'child': {'items': ['x'], 'name': 'base', 'opts': {'a': 1}},
+                                           'values': ['a']})
+        self.assertEqual(self.Counted.renders, 1)
+
+    def test_changes_invalidate(self):
+        child = self.Base()
+        obj = self.Counted(child=child)
+        obj.do_render()
+        obj.values.append('a')
+        self.assertEqual(obj.do_render()['values'], ['a'])
+        obj['values'] = ['b']
+        self.assertEqual(obj.do_render()['values'], ['b'])
+        child.opts['b'] = 2
+        self.assertEqual(obj.do_render()['child']['opts'], {'a': 1, 'b': 2})
+        child.name = 'other'
+        self.assertEqual(obj.do_render()['child']['name'], 'other')
+        self.assertEqual(self.Counted.renders, 5)
+
+    def test_shared_child(self):
+        child = self.Base()
+        first = self.Counted(child=child)
+        second = self.Counted(child=child)
+        first.do_render()
+        second.do_render()
+        first.do_render()
+        self.assertEqual(self.Counted.renders, 2)
+
+        child.name = 'other'
+        self.assertEqual(first.do_render()['child']['name'], 'other')
+        self.assertEqual(second.do_render()['child']['name'], 'other')
+        self.assertEqual(self.Counted.renders, 4)
+
+    def test_child_metadata(self):
+        class WithMetadata(KubeSubObj):
+            has_metadata = True
+            _defaults = {'name': 'meta'}
+            _types = {'name': String}
+
+            def render(self):
+                return {'metadata': {'name': self._data['name']}}
+
+        class Parent(self.Counted):
+            _types = {'child': Nullable(WithMetadata)}
+
+        child = WithMetadata()
+        obj = Parent(child=child)
+        obj.do_render()
+        child.labels['a'] = 'b'
+        self.assertEqual(obj.do_render()['child']['metadata']['labels'], {'a': 'b'})
+        self.assertEqual(self.Counted.renders, 2)
+
+    def test_new_sub_object(self):
+        Base = self.Base
+
+        class Holder(KubeSubObj):
+            _defaults = {'children': [], 'by_name': {}}
+            _types = {'children': List(Base), 'by_name': Map(String, Base)}
+
+            def render(self):
+                return self.renderer()
+
+        obj = Holder()
+        obj.new_children(name='first')
+        obj.new_by_name('a', name='first')
+        obj.do_render()
+
+        obj.new_children(name='second')
+        obj.new_by_name('b', name='second')
+        rendered = obj.do_render()
+        self.assertEqual(list(map(lambda x: x['name'], rendered['children'])), ['first', 'second'])
+        self.assertEqual(sorted(rendered['by_name'].keys()), ['a', 'b'])
+
+    def test_child_read_by_xform(self):
+        class Summary(self.Counted):
+            _types = {'child': Nullable(String)}
+
+            def xf_child(self, v):
+                # uses the child without rendering it
+                return None if v is None or len(v.items) == 0 else v.items[0]
+
+            def render(self):
+                Summary.renders += 1
+                return {'first': self._data['child']}
+
+        Summary.renders = 0
+        child = self.Base(items=['a'])
+        obj = Summary(child=child)
+        self.assertEqual(obj.do_render(), {'first': 'a'})
+        self.assertEqual(obj.do_render(), {'first': 'a'})
+        self.assertEqual(Summary.renders, 1)
+
+        child.items = ['b']
+        self.assertEqual(obj.do_render(), {'first': 'b'})
+        child.items.append('c')
+        child.items[0] = 'c'
+        self.assertEqual(obj.do_render(), {'first': 'c'})
+        self.assertEqual(Summary.renders, 3)
+
+    def test_always_regenerate(self):
+        obj = self.Regenerated()
+        obj.do_render()
+        obj.do_render()
+        self.assertEqual(self.Counted.renders, 2)
+
+    def test_validated_once(self):
+        self.Base.validations = 0
+        obj = self.Regenerated(child=self.Base())
+        obj.do_render()
+        self.assertEqual(self.Base.validations, 1)
+        obj.do_render()
+        self.assertEqual(self.Base.validations, 2)
+
+        self.Base.validations = 0
+        obj = self.Counted(child=self.Base())
+        obj.do_render()
+        obj.do_render()
+        self.assertEqual(self.Base.validations, 1)
+
+    def test_render_changes_data(self):
+        class Changing(KubeSubObj):
+            _defaults = {'values': []}
+            _types = {'values': List(String)}
+            _always_regenerate = True
+
+            def render(self):
+                self._data['values'] = self._data['values'] + ['rendered']
+                return self.renderer()
+
+        class Pair(KubeSubObj):
+            _defaults = {'first': None, 'second': None}
+            _types = {'first': Nullable(Changing), 'second': Nullable(Changing)}
+
+            def render(self):
+                return self.renderer()
+
+        child = Changing(values=['a'])
+        obj = Pair(first=child, second=child)
+        self.assertEqual(obj.do_render(), {'first': {'values': ['a', 'rendered']},
+                                           'second': {'values': ['a', 'rendered']}})
+        self.assertEqual(child.values, ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
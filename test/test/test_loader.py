@@ -0,0 +1,60 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+import python_path
+import loader
+
+
+class FakePath(object):
+    def __init__(self, name):
+        self.src_rel_path = name
+        self.full_path = '/' + name
+
+    def __str__(self):
+        return self.full_path
+
+
+class TestLoaderDeps(unittest.TestCase):
+    def setUp(self):
+        self.loader = loader.Loader(None)
+
+    def add(self, src, dst=None):
+        self.loader.add_dep(FakePath(src), None if dst is None else FakePath(dst))
+
+    def test_no_loop(self):
+        self.add('a.gkube', 'b.kube')
+        self.add('a.gkube', 'c.kube')
+        self.add('b.kube', 'c.kube')
+        self.add('c.kube', 'd.kube')
+        self.add('b.kube', 'c.kube')
+        self.loader.check_deps()
+        self.assertEqual(self.loader.deps['a.gkube'], set(['b.kube', 'c.kube']))
+
+    def test_self_loop(self):
+        with self.assertRaises(loader.LoaderLoopException) as cm:
+            self.add('a.kube', 'a.kube')
+        self.assertEqual(str(cm.exception), 'Loop detected: a.kube imports a.kube')
+
+    def test_loop_path(self):
+        self.add('a.kube', 'b.kube')
+        self.add('b.kube', 'c.kube')
+        self.add('x.kube', 'c.kube')
+        with self.assertRaises(loader.LoaderLoopException) as cm:
+            self.add('c.kube', 'a.kube')
+        self.assertEqual(str(cm.exception), 'Loop detected: c.kube imports a.kube imports b.kube imports c.kube')
+
+    def test_full_check(self):
+        self.loader.deps = {'a': set(['b']), 'b': set(['c']), 'c': set(['b']), 'd': set()}
+        with self.assertRaises(loader.LoaderLoopException) as cm:
+            self.loader.check_deps()
+        self.assertEqual(str(cm.exception), 'Loop detected: b imports c imports b')
+
+
+if __name__ == '__main__':
+    unittest.main()
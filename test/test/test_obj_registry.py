@@ -0,0 +1,77 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import gc
+import unittest
+
+import python_path
+
+import kube_loader
+import kube_objs
+import rubiks_repository
+from obj_registry import ObjectRegistry, get_ns, obj_registry
+
+
+class TestObjectRegistry(unittest.TestCase):
+    def setUp(self):
+        repo = rubiks_repository.RubiksRepository()
+        kube_loader.load(*[x.get_module_path() for x in repo.get_modules()])
+
+    def test_get_ns(self):
+        ns = get_ns(None, 'regtest1')
+        self.assertIs(get_ns(None, 'regtest1'), ns)
+        self.assertEqual(obj_registry().get_id(kube_objs.Namespace, 'regtest1'), [ns])
+
+    def test_identifier_changed(self):
+        ns = get_ns(None, 'regtest2')
+        ns.name = 'regtest3'
+        self.assertIsNone(obj_registry().get_id(kube_objs.Namespace, 'regtest2'))
+        self.assertEqual(obj_registry().get_id(kube_objs.Namespace, 'regtest3'), [ns])
+        self.assertIsNot(get_ns(None, 'regtest2'), ns)
+
+    def test_no_identifier_yet(self):
+        ns = kube_objs.Namespace()
+        self.assertIsNone(obj_registry().get_id(kube_objs.Namespace, 'regtest4'))
+        ns['name'] = 'regtest4'
+        self.assertEqual(obj_registry().get_id(kube_objs.Namespace, 'regtest4'), [ns])
+
+    def test_parents(self):
+        dpl = kube_objs.Deployment('regtest')
+        pts = dpl.pod_template
+        self.assertEqual(pts.get_parents(), [dpl])
+
+        dpl.pod_template = kube_objs.PodTemplateSpec()
+        self.assertEqual(pts.get_parents(), [])
+        self.assertEqual(dpl.pod_template.get_parents(), [dpl])
+
+        dpl2 = kube_objs.Deployment('regtest2', pod_template=pts)
+        self.assertEqual(pts.get_parents(), [dpl2])
+
+    def test_weak(self):
+        reg = ObjectRegistry()
+        reg.set_weak()
+        ns = kube_objs.Namespace('regtest5', _no_add=True)
+        keep = kube_objs.ConfigMap('keep', _no_add=True)
+        reg.add(ns)
+        reg.add(keep)
+        reg.new_context('ctx')
+        reg.add(kube_objs.ConfigMap('temp', _no_add=True))
+        self.assertEqual(reg.get_counts(), {'Namespace': 1, 'ConfigMap': 2})
+
+        self.assertEqual(len(reg.close_context('ctx')), 1)
+        gc.collect()
+        self.assertEqual(reg.get_counts(), {'Namespace': 1, 'ConfigMap': 1})
+        self.assertEqual(reg.get_id(kube_objs.ConfigMap, 'keep'), [keep])
+        self.assertIsNone(reg.get_id(kube_objs.ConfigMap, 'temp'))
+
+        del ns
+        gc.collect()
+        self.assertEqual(len(reg.get_id(kube_objs.Namespace, 'regtest5')), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import os
+import shutil
 import subprocess
 import tempfile
 import unittest
@@ -44,7 +45,7 @@ class FakeOutputMember(object):
     def filename_conversion(self, filename):
         return filename.replace(':', '_')
 
-    def write_file(self, path):
+    def prepare_file(self, path):
         if self.uses_namespace:
             path = os.path.join(path, self.namespace_name)
         self.coll().written.append(os.path.join(path, self.filename_conversion(self.identifier) + '.yaml'))
@@ -55,7 +56,8 @@ class BaseOutputTest(unittest.TestCase):
         self.repo = rubiks_repository.RubiksRepository()
         modules = [x.get_module_path() for x in self.repo.get_modules()]
         kube_loader.load(*modules)
-        self.collection = output.OutputCollection(loader.Loader(self.repo), self.repo)
+        self.loader = loader.Loader(self.repo)
+        self.collection = output.OutputCollection(self.loader, self.repo)
         self.collection.confidential = output.ConfidentialOutput
         self.collection.written = []
 
@@ -93,3 +95,44 @@ class EasyClusterOutput(BaseOutputTest):
             base + 'service-test1.yaml',
             base + 'secret-docker-pull.yaml',
             ]))
+
+
+class TestWriteFile(BaseOutputTest):
+    def setUp(self):
+        BaseOutputTest.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, 'default'))
+        self.path = os.path.join(self.dir, 'default', 'configmap-test.yaml')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, value, content_check=None):
+        cm = kube_objs.ConfigMap('test', files={'a': value})
+        cm.set_namespace('default')
+        return output.OutputMember(self.collection, cm, None, content_check=content_check).write_file(self.dir)
+
+    def set_mtime(self):
+        os.utime(self.path, (1000000000, 1000000000))
+
+    def test_unchanged_not_rewritten(self):
+        self.assertIsNone(self.write('b'))
+        self.set_mtime()
+        self.assertIsNone(self.write('b', content_check='contents'))
+        self.assertEqual(os.path.getmtime(self.path), 1000000000)
+
+        self.assertIsNone(self.write('c'))
+        self.assertNotEqual(os.path.getmtime(self.path), 1000000000)
+        with open(self.path) as f:
+            self.assertIn('a: c', f.read())
+
+    def test_changed(self):
+        self.assertEqual(self.write('b', content_check='exists'), self.path)
+        self.assertIsNone(self.write('c', content_check='exists'))
+        self.assertEqual(self.write('d', content_check='contents'), self.path)
+        self.assertEqual(self.write('longer', content_check='yaml'), self.path)
+
+        with open(self.path, 'a') as f:
+            f.write('# comment\n')
+        self.assertIsNone(self.write('longer', content_check='yaml'))
+        self.assertIsNone(self.write('longer', content_check='contents'))
@@ -0,0 +1,78 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import python_path
+import output_manifest
+
+
+class FakeRepository(object):
+    def __init__(self, basepath):
+        self.basepath = basepath
+        self.sources = 'sources'
+        self.outputs = 'generated'
+
+
+class TestOutputManifest(unittest.TestCase):
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.repo = FakeRepository(self.base)
+        self.outputs = os.path.join(self.base, 'generated')
+        for f in ('a/ns1/x.yaml', 'a/ns1/y.yaml', 'a/ns2/z.yaml', 'a/ns2/manual.yaml'):
+            self.write_output(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def write_output(self, relpath):
+        path = os.path.join(self.outputs, relpath)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write('')
+
+    def exists(self, relpath):
+        return os.path.exists(os.path.join(self.outputs, relpath))
+
+    def test_no_manifest(self):
+        manifest = output_manifest.OutputManifest(self.repo)
+        self.assertEqual(manifest.prune(self.outputs, set(['a/ns1/x.yaml'])), [])
+        self.assertTrue(self.exists('a/ns1/y.yaml'))
+
+    def test_prune(self):
+        output_manifest.OutputManifest(self.repo).save(set(['a/ns1/x.yaml', 'a/ns1/y.yaml', 'a/ns2/z.yaml']))
+
+        manifest = output_manifest.OutputManifest(self.repo)
+        removed = manifest.prune(self.outputs, set(['a/ns1/x.yaml']))
+        self.assertEqual(removed, [os.path.join(self.outputs, 'a/ns1/y.yaml'),
+                                   os.path.join(self.outputs, 'a/ns2/z.yaml')])
+        self.assertTrue(self.exists('a/ns1/x.yaml'))
+        self.assertFalse(self.exists('a/ns1/y.yaml'))
+        self.assertTrue(self.exists('a/ns2/manual.yaml'))
+
+    def test_empty_dirs_removed(self):
+        output_manifest.OutputManifest(self.repo).save(set(['a/ns1/x.yaml', 'a/ns1/y.yaml']))
+        os.unlink(os.path.join(self.outputs, 'a/ns2/z.yaml'))
+        os.unlink(os.path.join(self.outputs, 'a/ns2/manual.yaml'))
+
+        output_manifest.OutputManifest(self.repo).prune(self.outputs, set())
+        self.assertFalse(self.exists('a/ns1'))
+        self.assertTrue(self.exists('a/ns2'))
+
+    def test_outputs_moved(self):
+        output_manifest.OutputManifest(self.repo).save(set(['a/ns1/x.yaml', 'a/ns1/y.yaml']))
+        self.repo.outputs = 'elsewhere'
+        self.assertEqual(output_manifest.OutputManifest(self.repo).prune(self.outputs, set()), [])
+        self.assertTrue(self.exists('a/ns1/y.yaml'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import python_path
+import output_writer
+
+
+class FakeOutputMember(object):
+    def __init__(self, filedir, filename, delay=0, error=None):
+        self.filedir = filedir
+        self.filename = filename
+        self.delay = delay
+        self.error = error
+
+    def store_file(self, path, data, fsync=False):
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        with open(os.path.join(path, self.filename), 'wb') as f:
+            f.write(data)
+        return os.path.join(path, self.filename)
+
+
+class TestOutputWriter(unittest.TestCase):
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def write(self, ops, threads=4, fsync=False):
+        with output_writer.OutputWriter(threads, fsync) as writer:
+            for op in ops:
+                writer.write(op, b'data')
+            return writer.finish()
+
+    def test_queue_order(self):
+        ns1 = os.path.join(self.base, 'ns1')
+        ns2 = os.path.join(self.base, 'a', 'ns2')
+        ops = [FakeOutputMember(ns1, 'x.yaml', delay=0.05), FakeOutputMember(ns2, 'y.yaml'),
+               FakeOutputMember(ns1, 'z.yaml')]
+        expected = [os.path.join(ns1, 'x.yaml'), os.path.join(ns2, 'y.yaml'), os.path.join(ns1, 'z.yaml')]
+
+        self.assertEqual(self.write(ops), expected)
+        self.assertEqual(self.write(ops, threads=1, fsync=True), expected)
+        with open(os.path.join(ns2, 'y.yaml'), 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+
+    def test_first_error(self):
+        ops = [FakeOutputMember(self.base, 'x.yaml'),
+               FakeOutputMember(self.base, 'y.yaml', delay=0.05, error=ValueError('y')),
+               FakeOutputMember(self.base, 'z.yaml', error=KeyError('z'))]
+        self.assertRaises(ValueError, self.write, ops)
+        # everything queued before the error was still written
+        self.assertTrue(os.path.exists(os.path.join(self.base, 'x.yaml')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+import python_path
+
+import kube_loader
+import kube_objs
+import loader
+import output
+import parallel_loader
+import rubiks_repository
+from obj_registry import get_ns
+from user_error import UserError
+
+
+class TestPartition(unittest.TestCase):
+    def test_independent(self):
+        parts = parallel_loader.partition(['a.gkube', 'b.gkube', 'c.gkube'], {}, 2)
+        self.assertEqual(len(parts), 2)
+        self.assertEqual(sorted(sum(parts, [])), ['a.gkube', 'b.gkube', 'c.gkube'])
+
+    def test_importing_kept_together(self):
+        deps = {'a.gkube': ['lib.kube', 'c.gkube'], 'b.gkube': ['lib.kube']}
+        parts = parallel_loader.partition(['a.gkube', 'b.gkube', 'c.gkube'], deps, 3)
+        self.assertEqual(sorted(parts), [['a.gkube', 'c.gkube'], ['b.gkube']])
+
+    def test_balanced(self):
+        cost = {'a.gkube': 10, 'b.gkube': 6, 'c.gkube': 5}
+        parts = parallel_loader.partition(['a.gkube', 'b.gkube', 'c.gkube'], {}, 2, cost=lambda x: cost[x])
+        self.assertEqual(sorted(parts), [['a.gkube'], ['b.gkube', 'c.gkube']])
+
+    def test_per_cluster_items(self):
+        items = [('a.ekube', 0), ('a.ekube', 1), ('b.gkube', -1)]
+        parts = parallel_loader.partition(items, {}, 3, key=lambda x: x[0])
+        self.assertEqual(sorted(parts), [[('a.ekube', 0)], [('a.ekube', 1)], [('b.gkube', -1)]])
+
+        parts = parallel_loader.partition(items, {'b.gkube': ['a.ekube']}, 3, key=lambda x: x[0])
+        self.assertEqual(parts, [items])
+
+    def test_order_kept(self):
+        parts = parallel_loader.partition(['a.gkube', 'b.gkube', 'c.gkube'], {}, 1)
+        self.assertEqual(parts, [['a.gkube', 'b.gkube', 'c.gkube']])
+
+
+class TestMerge(unittest.TestCase):
+    def setUp(self):
+        self.repo = rubiks_repository.RubiksRepository()
+        modules = [x.get_module_path() for x in self.repo.get_modules()]
+        kube_loader.load(*modules)
+        self.collection = output.OutputCollection(loader.Loader(self.repo), self.repo)
+
+    def roundtrip(self, obj):
+        return parallel_loader._loads(parallel_loader._dumps(obj), ())
+
+    def test_namespace_shared(self):
+        ns = get_ns(None, 'partest')
+        cm = kube_objs.ConfigMap('test', files={'a': 'b'})
+        cm.set_namespace('partest')
+
+        ncm = self.roundtrip(cm)
+        self.assertIsNot(ncm, cm)
+        self.assertIs(ncm.__class__, kube_objs.ConfigMap)
+        self.assertIs(ncm.namespace, ns)
+        self.assertEqual(ncm.do_render(), cm.do_render())
+
+    def test_namespace_label_conflict(self):
+        ns = get_ns(None, 'partest2')
+        data = parallel_loader._dumps(ns)
+        ns.labels['x'] = 'y'
+        self.assertIs(parallel_loader._loads(data, ()), ns)
+        ns.labels['x'] = 'z'
+        data = parallel_loader._dumps(ns)
+        ns.labels['x'] = 'y'
+        self.assertRaises(UserError, parallel_loader._loads, data, ())
+
+    def merge(self, kobj, origin, owner):
+        kobj.set_namespace('default')
+        self.collection.merge_output(kobj, None, kobj.do_render(), [owner], origin=origin, owner=owner)
+
+    def test_same_source_in_two_workers(self):
+        self.merge(kube_objs.ConfigMap('same', files={'a': 'b'}), 0, 'lib.gkube')
+        self.merge(kube_objs.ConfigMap('same', files={'a': 'b'}), 1, 'lib.gkube')
+        self.assertEqual(sorted(self.collection.clusterless['default']['configmap-same'].sources), ['lib.gkube'])
+
+    def test_different_sources(self):
+        self.merge(kube_objs.ConfigMap('diff', files={'a': 'b'}), 0, 'a.gkube')
+        self.assertRaises(UserError, self.merge, kube_objs.ConfigMap('diff', files={'a': 'b'}), 1, 'b.gkube')
+
+    def test_different_content(self):
+        self.merge(kube_objs.ConfigMap('content', files={'a': 'b'}), 0, 'lib.gkube')
+        self.assertRaises(UserError, self.merge, kube_objs.ConfigMap('content', files={'a': 'c'}), 1, 'lib.gkube')
+
+
+if __name__ == '__main__':
+    unittest.main()
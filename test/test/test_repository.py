@@ -0,0 +1,68 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import python_path
+import repository
+
+
+class TestRepository(unittest.TestCase):
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        self.repo = os.path.join(self.tmp, 'repo')
+        os.makedirs(os.path.join(self.repo, 'sources', 'sub'))
+        self.git('init', '-q', self.repo)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def git(self, *args):
+        with open(os.devnull, 'w') as null:
+            subprocess.check_call(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args),
+                                  cwd=self.tmp, stdout=null, stderr=null)
+
+    def test_worktree(self):
+        r = repository.Repository(cwd=os.path.join(self.repo, 'sources', 'sub'))
+        self.assertEqual(r.basepath, self.repo)
+        self.assertEqual(r.find_worktree_fast(), self.repo)
+
+        self.assertRaises(repository.RepositoryError, repository.Repository, cwd=self.tmp)
+
+    def test_linked_worktree(self):
+        with open(os.path.join(self.repo, 'sources', 'a.kube'), 'w') as f:
+            f.write('\n')
+        self.git('-C', self.repo, 'add', '.')
+        self.git('-C', self.repo, 'commit', '-q', '-m', 'a')
+        self.git('-C', self.repo, 'worktree', 'add', '-q', os.path.join(self.tmp, 'linked'))
+
+        # as before, git gives the main working tree
+        r = repository.Repository(cwd=os.path.join(self.tmp, 'linked', 'sources'))
+        self.assertEqual(r.find_worktree_fast(), None)
+        self.assertEqual(r.basepath, self.repo)
+
+    def test_lazy_status(self):
+        with open(os.path.join(self.repo, 'sources', 'a.kube'), 'w') as f:
+            f.write('\n')
+        self.git('-C', self.repo, 'add', '.')
+        self.git('-C', self.repo, 'commit', '-q', '-m', 'a')
+
+        r = repository.Repository(cwd=self.repo)
+        self.assertEqual(r._status, None)
+
+        with open(os.path.join(self.repo, 'sources', 'a.kube'), 'w') as f:
+            f.write('changed\n')
+        self.assertTrue(b'sources/a.kube' in r.status.modifications)
+        self.assertTrue(r.status is r.status)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,12 +6,15 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import os
+import shutil
+import tempfile
 import unittest
 
 import python_path
 import loader
 import repository
 import lookup
+import timing
 from kube_vartypes import Confidential
 from user_error import UserError
 
@@ -26,13 +29,13 @@ class FakeClusterInfo(object):
         self.name = name
 
 
-class TestResolver(unittest.TestCase):
-    def get_path(self, path):
-        return loader.Path(os.path.join(repo.basepath, 'test/test/data', path), repo)
+class FakeRepository(object):
+    def __init__(self, basepath):
+        self.basepath = basepath
+        self.sources = '.'
 
-    def tearDown(self):
-        Resolver.current_cluster = None
 
+class UserErrorAssertions(object):
     def assertRaises(self, exc, fn, *args, **kwargs):
         try:
             fn(*args, **kwargs)
@@ -46,6 +49,14 @@ class TestResolver(unittest.TestCase):
             raise
         raise AssertionError("not true")
 
+
+class TestResolver(UserErrorAssertions, unittest.TestCase):
+    def get_path(self, path):
+        return loader.Path(os.path.join(repo.basepath, 'test/test/data', path), repo)
+
+    def tearDown(self):
+        Resolver.current_cluster = None
+
     def test_basic_yaml(self):
         res = Resolver([self.get_path('normal.yaml')])
 
@@ -104,6 +115,10 @@ class TestResolver(unittest.TestCase):
 
         self.assertRaises(Exception, Resolver, [self.get_path('nonexistent.yaml')], non_exist_ok=False)
 
+        # the files after a missing one are still read
+        res = Resolver([self.get_path('nonexistent.yaml'), self.get_path('normal.yaml')])
+        self.assertEqual(res.get_key('foo.bar.baz', 'foo.bar', 'foo'), 'qux')
+
     def test_basic_fallback(self):
         res = Resolver([self.get_path('normal.yaml')])
 
@@ -175,5 +190,81 @@ class TestResolver(unittest.TestCase):
         self.assertRaises(ValueError, Resolver, [self.get_path('crypted.yaml'), self.get_path('normal.yaml')])
 
 
+class TestResolverCache(UserErrorAssertions, unittest.TestCase):
+    def setUp(self):
+        lookup.clear_cache()
+        timing.enable()
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        timing.disable()
+        lookup.clear_cache()
+        shutil.rmtree(self.tmp)
+
+    def get_path(self, path):
+        return loader.Path(os.path.join(self.tmp, path), FakeRepository(self.tmp))
+
+    def write(self, path, content, mtime):
+        with open(os.path.join(self.tmp, path), 'w') as f:
+            f.write(content)
+        os.utime(os.path.join(self.tmp, path), (mtime, mtime))
+
+    def test_cached(self):
+        self.write('a.yaml', 'foo:\n  bar: [1, 2]\n', 1000000000)
+
+        res1 = Resolver([self.get_path('a.yaml')])
+        res2 = Resolver([self.get_path('a.yaml')])
+        self.assertEqual(timing._counters, {'lookup cache hits': 1, 'lookup cache misses': 1})
+
+        # callers can't change what other lookups see
+        res1.get_key('foo.bar').append(3)
+        res1.data['foo'] = {}
+        self.assertEqual(res2.get_key('foo.bar'), [1, 2])
+        self.assertEqual(Resolver([self.get_path('a.yaml')]).get_key('foo.bar'), [1, 2])
+
+        self.write('a.yaml', 'foo:\n  bar: [3, 4]\n', 1000000001)
+        self.assertEqual(Resolver([self.get_path('a.yaml')]).get_key('foo.bar'), [3, 4])
+        self.assertEqual(timing._counters['lookup cache misses'], 2)
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'no symlinks')
+    def test_symlink(self):
+        self.write('a.yaml', 'foo: 1\n', 1000000000)
+        # a path resolved before the link was made still points at the same document
+        path = self.get_path('b.yaml')
+        os.symlink('a.yaml', os.path.join(self.tmp, 'b.yaml'))
+
+        Resolver([self.get_path('a.yaml')])
+        self.assertEqual(Resolver([path]).get_key('foo'), 1)
+        self.assertEqual(timing._counters, {'lookup cache hits': 1, 'lookup cache misses': 1})
+
+    def test_index(self):
+        self.write('a.yaml', 'a:\n  b.c: 1\n  1: 2\n  d: {e: [1], f: null}\nb: {c: 1}\n', 1000000000)
+        self.write('b.json', '{"b": {"d": 2}}', 1000000000)
+        res = Resolver([self.get_path('a.yaml'), self.get_path('b.json')])
+
+        self.assertEqual(res.get_key('a.d.e'), [1])
+        self.assertEqual(res.get_key('a.d.f'), None)
+        self.assertEqual(res.get_key('a.d.x', 'b.d'), 2)
+        self.assertEqual(res.get_branches('a.d'), ('e', 'f'))
+        self.assertEqual(res.get_branches('a.d.e'), ())
+
+        # keys which can't be reached by walking the path
+        self.assertRaises(lookup.KeyNotExist, res.get_key, 'a.b.c')
+        self.assertRaises(lookup.KeyNotExist, res.get_key, 'a.1')
+        # the later file replaces the whole of b
+        self.assertRaises(lookup.KeyNotExist, res.get_key, 'b.c')
+        self.assertRaises(lookup.KeyIsBranch, res.get_key, 'a.d')
+
+        res = Resolver([self.get_path('a.yaml')], assert_type=int, default=3)
+        self.assertEqual(res.get_key('a.d.e', 'b.c'), 1)
+        self.assertEqual(res.get_key('a.d.e'), 3)
+
+    def test_unparseable(self):
+        self.write('a.yaml', 'foo: [\n', 1000000000)
+        for _ in range(2):
+            self.assertRaises(ValueError, Resolver, [self.get_path('a.yaml')])
+            self.assertFalse(Resolver([self.get_path('a.yaml')], fail_ok=True).has_data)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,91 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import python_path
+import source_cache
+
+
+class FakeRepository(object):
+    def __init__(self, basepath):
+        self.basepath = basepath
+        self.sources = 'sources'
+        self.outputs = 'generated'
+
+
+class TestSourceCache(unittest.TestCase):
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.repo = FakeRepository(self.base)
+        os.mkdir(os.path.join(self.base, 'sources'))
+        os.mkdir(os.path.join(self.base, 'generated'))
+        self.write_src('a.gkube', 'import_python("lib.kube")')
+        self.write_src('b.gkube', '')
+        self.write_src('lib.kube', '')
+        with open(os.path.join(self.base, 'generated', 'a.yaml'), 'w') as f:
+            f.write('')
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def write_src(self, name, content):
+        with open(os.path.join(self.base, 'sources', name), 'w') as f:
+            f.write(content)
+
+    def save_cache(self, volatile=()):
+        cache = source_cache.SourceCache(self.repo)
+        cache.save({'a.gkube': set(['lib.kube']), 'lib.kube': set(), 'b.gkube': set()},
+                   set(volatile), {'a.gkube': set([('a.yaml', False)]), 'b.gkube': set()})
+
+    def test_unchanged_is_fresh(self):
+        self.save_cache()
+        cache = source_cache.SourceCache(self.repo)
+        self.assertTrue(cache.is_fresh('a.gkube'))
+        self.assertTrue(cache.is_fresh('b.gkube'))
+        self.assertFalse(cache.is_fresh('c.gkube'))
+
+    def test_changed_import(self):
+        self.save_cache()
+        self.write_src('lib.kube', 'x = 1')
+        cache = source_cache.SourceCache(self.repo)
+        self.assertFalse(cache.is_fresh('a.gkube'))
+        self.assertTrue(cache.is_fresh('b.gkube'))
+
+    def test_missing_output(self):
+        self.save_cache()
+        os.unlink(os.path.join(self.base, 'generated', 'a.yaml'))
+        cache = source_cache.SourceCache(self.repo)
+        self.assertFalse(cache.is_fresh('a.gkube'))
+
+    def test_volatile(self):
+        self.save_cache(volatile=('lib.kube',))
+        cache = source_cache.SourceCache(self.repo)
+        self.assertFalse(cache.is_fresh('a.gkube'))
+        self.assertTrue(cache.is_fresh('b.gkube'))
+
+    def test_reuse_carried_forward(self):
+        self.save_cache()
+        cache = source_cache.SourceCache(self.repo)
+        self.assertEqual(cache.reuse('a.gkube'), [['a.yaml', False]])
+        cache.save({'b.gkube': set()}, set(), {'b.gkube': set()})
+        cache = source_cache.SourceCache(self.repo)
+        self.assertTrue(cache.is_fresh('a.gkube'))
+        self.assertEqual(sorted(cache.closure('a.gkube')), ['a.gkube', 'lib.kube'])
+
+    def test_load_deps(self):
+        self.assertEqual(source_cache.load_deps(self.repo), {})
+        self.save_cache()
+        self.write_src('lib.kube', 'x = 1')
+        self.assertEqual(source_cache.load_deps(self.repo), {'a.gkube': ['lib.kube'], 'b.gkube': [], 'lib.kube': []})
+
+
+if __name__ == '__main__':
+    unittest.main()
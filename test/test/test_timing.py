@@ -0,0 +1,72 @@
+# (c) Copyright 2018 OLX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import python_path
+import timing
+
+
+class TestTiming(unittest.TestCase):
+    def tearDown(self):
+        timing.disable()
+
+    def test_disabled(self):
+        with timing.phase('compile', 'a.gkube'):
+            pass
+        self.assertFalse(timing.is_enabled())
+        self.assertEqual(timing._phases, {})
+
+    def test_nested(self):
+        timing.enable()
+        with timing.phase('compile', 'a.gkube'):
+            time.sleep(0.02)
+            with timing.phase('render'):
+                pass
+            with timing.phase('compile', 'lib.kube'):
+                time.sleep(0.05)
+
+        self.assertEqual(timing._phases['compile'][0], 2)
+        self.assertEqual(timing._phases['render'][0], 1)
+        self.assertGreaterEqual(timing._phases['compile'][1], 0.07)
+        self.assertLess(timing._phases['compile'][1], 0.15)
+
+        # the per-source times don't include the sources they imported
+        self.assertLess(timing._keys[('compile', 'a.gkube')][1], 0.05)
+        self.assertGreaterEqual(timing._keys[('compile', 'lib.kube')][1], 0.05)
+
+        out = io.StringIO()
+        timing.report(top=1, f=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[-2], 'slowest compile (1 of 2, excluding nested ones)')
+        self.assertTrue(lines[-1].endswith('lib.kube'))
+
+    def test_trace(self):
+        timing.enable(trace=True)
+        with timing.phase('compile', 'a.gkube'):
+            with timing.phase('render'):
+                pass
+
+        d = tempfile.mkdtemp()
+        try:
+            timing.write_trace(os.path.join(d, 'trace.json'))
+            with open(os.path.join(d, 'trace.json')) as f:
+                events = json.load(f)['traceEvents']
+        finally:
+            shutil.rmtree(d)
+        self.assertEqual(list(map(lambda x: (x['name'], x['cat'], x['ph']), events)),
+                         [('render', 'render', 'X'), ('a.gkube', 'compile', 'X')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -164,6 +164,23 @@ class TestBasicTypes(unittest.TestCase):
         Path().check('/a/b/c')
         Path().check('/a')
 
+    def test_checker_matches_check(self):
+        types = [Boolean(), Integer(), Number(), String(), Enum('a', 'b'), Identifier(), Path(),
+                 Nullable(String), NonEmpty(String), NonEmpty(List(String)), Positive(Integer),
+                 Positive(Number), NonZero(Integer), Positive(NonZero(Integer)), List(String),
+                 Map(Integer, String), Map(String, List(Integer)), OneOf(Positive(NonZero(Integer)), Identifier)]
+        values = [None, True, False, 0, 1, -1, 5.5, -5.5, '', 'a', 'abc-def', 'ABC', '/a', 'a' * 254,
+                  [], ['a'], ['a', None], [1, 2], ('a',), {}, {1: 'a'}, {'a': 'b'}, {'a': [1]},
+                  OrderedDict([('a', [1, 2])]), {'a': ['b']}]
+
+        for t in types:
+            for v in values:
+                try:
+                    expected = bool(t.check(v))
+                except user_error.UserError:
+                    expected = False
+                self.assertEqual(t.checker()(v), expected, '{} on {}'.format(t.name(), repr(v)))
+
     def assertNameFormatter(self, cls):
         # Markdown link renderer
         md_render = lambda x: '[{}](#{})'.format(x, x.lower())
@@ -6,10 +6,22 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from collections import OrderedDict
+import random
+import sys
 import unittest
 
 import python_path
 import kube_yaml
+import var_types
+import yaml
+
+
+class Upper(var_types.VarEntity):
+    def init(self, value):
+        self.value = value
+
+    def to_string(self):
+        return self.value.upper()
 
 
 class TestBasicYAML(unittest.TestCase):
@@ -57,5 +69,100 @@ qux: |-
         src = {'foo': '0012345abc'}
         dst = "foo: 0012345abc"
         self.assertEqual(kube_yaml.yaml_safe_dump(src).strip(), dst.strip())
+
+    def test_var_entities(self):
+        src = OrderedDict(foo='plain')
+        src['bar'] = [Upper('abc'), 'x', Upper('de')]
+        src['baz'] = {'qux': Upper('fgh')}
+        dst = """
+foo: plain
+bar:
+- ABC
+- x
+- DE
+baz:
+  qux: FGH
+"""
+        out = kube_yaml.yaml_safe_dump(src)
+        self.assertTrue(isinstance(out, var_types.VarEntity))
+        self.assertEqual(str(out).strip(), dst.strip())
+
+        out = kube_yaml.yaml_safe_dump_all([{'a': Upper('b')}, {'c': 'd'}])
+        self.assertEqual(str(out).strip(), 'a: B\n---\nc: d')
+
+        self.assertEqual(kube_yaml.yaml_safe_dump_all([{'a': 'b'}] * 3).strip(), 'a: b\n---\na: b\n---\na: b')
+
+class RandomDocuments(object):
+    STRINGS = ['', 'a', 'abc', '123', '0012', '12a', 'true', 'No', 'null', '~', '1.5', '1e3', '2001-01-01',
+               ' lead', 'trail ', 'a: b', 'a:b', '- x', '#c', 'a #c', 'multi\nline', 'multi\nline\n', '\nlead',
+               'sp \nx', '\n x', "it's", 'say "hi"', 'tab\tx', 'back\\slash', '---', '? x', '*a', '!x', '{x}',
+               'a,b', '<<', '0x1F', '+1', '\x07bell', 'a\r\nb', 'word ' * 30, 'w' * 130, 'k' * 125,
+               'x y ' * 40 + 'end']
+    ENTITIES = 0.05
+
+    def random_scalar(self, r):
+        if r.random() < 0.6:
+            return r.choice(self.STRINGS)
+        return r.choice([None, True, False, 0, 1, -5, 123456789012, 1.5, -0.25, 1e17, float('inf')])
+
+    def random_tree(self, r, depth=0):
+        c = r.random()
+        if depth > 4 or c < 0.3:
+            if r.random() < self.ENTITIES:
+                return Upper(r.choice(['v', 'multi\nline']))
+            return self.random_scalar(r)
+        if c < 0.55:
+            return [self.random_tree(r, depth + 1) for _ in range(r.randint(0, 4))]
+        keys = list(filter(lambda x: not isinstance(x, float), [self.random_scalar(r) for _ in range(r.randint(0, 4))]))
+        if r.random() < 0.5:
+            return OrderedDict(map(lambda k: (k, self.random_tree(r, depth + 1)), keys))
+        return dict(map(lambda k: (k, self.random_tree(r, depth + 1)), keys))
+
+    def pyyaml_dump(self, docs):
+        stream = kube_yaml.FakeStringIO()
+        yaml.dump_all(docs, stream=stream, Dumper=kube_yaml.SafeDumper, default_flow_style=False, allow_unicode=True)
+        return stream.get_value()
+
+
+class TestFastEmitter(RandomDocuments, unittest.TestCase):
+    def test_same_as_pyyaml(self):
+        r = random.Random(1)
+        for _ in range(500):
+            docs = [self.random_tree(r) for _ in range(r.randint(1, 3))]
+            fast = kube_yaml._fast_dump(docs)
+            self.assertIsNotNone(fast)
+            self.assertEqual(str(fast), str(self.pyyaml_dump(docs)), repr(docs))
+
+    def test_fallback(self):
+        shared = ['a', 'b']
+        self.assertIsNone(kube_yaml._fast_dump([{'x': shared, 'y': shared}]))
+        self.assertIsNone(kube_yaml._fast_dump([{'x': ('a', 'b')}]))
+        self.assertEqual(kube_yaml.yaml_safe_dump({'x': shared, 'y': shared}), 'x: &id001\n- a\n- b\ny: *id001\n')
+
+
+class TestLoad(RandomDocuments, unittest.TestCase):
+    ENTITIES = 0
+
+    def test_load(self):
+        self.assertEqual(kube_yaml.yaml_load('a: [1, x]\nb:\n  c: 2.5\n'), {'a': [1, 'x'], 'b': {'c': 2.5}})
+        self.assertEqual(list(kube_yaml.yaml_load_all('a\n---\n- b\n')), ['a', ['b']])
+        self.assertRaises(yaml.YAMLError, kube_yaml.yaml_load, 'a: [b')
+
+    @unittest.skipUnless(kube_yaml.have_libyaml, 'no PyYAML with libyaml installed')
+    def test_same_as_pyyaml(self):
+        self.assertIsNot(kube_yaml._libyaml, yaml)
+        self.assertIs(sys.modules['yaml'], yaml)
+
+        r = random.Random(1)
+        for _ in range(500):
+            docs = [self.random_tree(r) for _ in range(r.randint(1, 3))]
+            data = str(self.pyyaml_dump(docs))
+            self.assertEqual(kube_yaml.yaml_load_all(data), list(yaml.load_all(data, Loader=yaml.loader.Loader)), data)
+
+        data = ('a: 2001-12-14t21:59:43.10-05:00\nb: 2002-12-14\nc: [1e3, 1.0e+3, 012, 0o12, 0x1f, 1_0, .inf, ~]\n'
+                'd: 1:20:30\ne: [yes, no, on, "yes"]\nf: &x {g: 1}\nh: {<<: *x, i: !!binary aGVsbG8=}\n')
+        self.assertEqual(kube_yaml.yaml_load(data), yaml.load(data, Loader=yaml.loader.Loader))
+
+
 if __name__ == '__main__':
     unittest.main()